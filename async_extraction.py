@@ -0,0 +1,195 @@
+import os
+import time
+import asyncio
+from azure.ai.formrecognizer.aio import DocumentAnalysisClient as AsyncDocumentAnalysisClient
+from azure.core.credentials import AzureKeyCredential
+from azure_extraction import (
+    MODEL_MAP, ocr_cache, extract_fields_from_result, get_analysis_backend, AzureAnalysisBackend, ReplayAnalysisBackend
+)
+
+# Form Recognizer S0 allows 15 analyze requests per second; stay under it by default
+FORM_RECOGNIZER_TPS = float(os.getenv("FORM_RECOGNIZER_TPS", "15"))
+# Analyses in flight (submitted and still being polled) at any one time
+FORM_RECOGNIZER_MAX_CONCURRENCY = int(os.getenv("FORM_RECOGNIZER_MAX_CONCURRENCY", "10"))
+# Polling interval bounds in seconds; the interval adapts to observed analysis latency per model
+FORM_RECOGNIZER_POLL_MIN_SECONDS = float(os.getenv("FORM_RECOGNIZER_POLL_MIN_SECONDS", "0.25"))
+FORM_RECOGNIZER_POLL_MAX_SECONDS = float(os.getenv("FORM_RECOGNIZER_POLL_MAX_SECONDS", "5"))
+FORM_RECOGNIZER_POLL_INITIAL_SECONDS = float(os.getenv("FORM_RECOGNIZER_POLL_INITIAL_SECONDS", "1"))
+
+
+class AsyncRateLimiter:
+    """
+    Spaces out request starts so that no more than rate_per_second are issued.
+    """
+
+    def __init__(self, rate_per_second: float):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._next_start = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_start - now
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._next_start = max(now, self._next_start) + self.interval
+
+
+class AdaptivePollingInterval:
+    """
+    Chooses the poller interval per model from an exponentially weighted average of observed
+    analysis times, so short ID documents are polled quickly while long statements are not
+    polled needlessly often.
+    """
+
+    def __init__(self, initial: float, minimum: float, maximum: float, fraction: float = 0.25, smoothing: float = 0.3):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.fraction = fraction
+        self.smoothing = smoothing
+        self._average = {}
+
+    def interval(self, model_id: str) -> float:
+        average = self._average.get(model_id)
+        if average is None:
+            return self.initial
+        return min(max(average * self.fraction, self.minimum), self.maximum)
+
+    def observe(self, model_id: str, seconds: float):
+        average = self._average.get(model_id)
+        self._average[model_id] = seconds if average is None else (1 - self.smoothing) * average + self.smoothing * seconds
+
+    def averages(self) -> dict:
+        return dict(self._average)
+
+
+class AsyncDocumentAnalyzer:
+    """
+    Async Form Recognizer access for FastAPI agents and batch jobs. All analyses made through one
+    analyzer share a concurrency semaphore, a TPS rate limiter and the adaptive polling interval,
+    and go through the same OCR result cache and analysis backend as azure_extraction: the async
+    client is used with the Azure backend, other backends (record, replay) run in a worker thread.
+
+        async with AsyncDocumentAnalyzer() as analyzer:
+            results = await analyzer.extract_many([(pdf_bytes, "Bank Statement"), ...])
+    """
+
+    def __init__(self, endpoint: str = None, key: str = None, max_concurrency: int = FORM_RECOGNIZER_MAX_CONCURRENCY, tps: float = FORM_RECOGNIZER_TPS, polling: AdaptivePollingInterval = None):
+        self.endpoint = endpoint
+        self.key = key
+        self._client = None
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.rate_limiter = AsyncRateLimiter(tps)
+        self.polling = polling or AdaptivePollingInterval(
+            FORM_RECOGNIZER_POLL_INITIAL_SECONDS,
+            FORM_RECOGNIZER_POLL_MIN_SECONDS,
+            FORM_RECOGNIZER_POLL_MAX_SECONDS
+        )
+
+    @property
+    def client(self) -> AsyncDocumentAnalysisClient:
+        # Created on first use, so replaying fixtures needs no credentials
+        if self._client is None:
+            self._client = AsyncDocumentAnalysisClient(
+                endpoint=self.endpoint or os.getenv("FORM_RECOGNIZER_ENDPOINT"),
+                credential=AzureKeyCredential(self.key or os.getenv("FORM_RECOGNIZER_KEY"))
+            )
+        return self._client
+
+    async def analyze(self, data: bytes, model_id: str = "prebuilt-document"):
+        """
+        Async counterpart of azure_extraction.analyze_document.
+        """
+        backend = get_analysis_backend()
+        cacheable = ocr_cache is not None and getattr(backend, "cacheable", True)
+        cache_key = ocr_cache.make_key(data, model_id) if cacheable else None
+        if cache_key:
+            result = await asyncio.to_thread(ocr_cache.get, cache_key)
+            if result is not None:
+                return result
+
+        async with self.semaphore:
+            if isinstance(backend, AzureAnalysisBackend):
+                await self.rate_limiter.acquire()
+                started = time.monotonic()
+                poller = await self.client.begin_analyze_document(
+                    model_id,
+                    document=data,
+                    polling_interval=self.polling.interval(model_id)
+                )
+                result = await poller.result()
+                self.polling.observe(model_id, time.monotonic() - started)
+            else:
+                # Replayed fixtures never reach the service, so they skip the rate limit
+                if not isinstance(backend, ReplayAnalysisBackend):
+                    await self.rate_limiter.acquire()
+                result = await asyncio.to_thread(backend.analyze, data, model_id)
+
+        if cache_key:
+            try:
+                await asyncio.to_thread(ocr_cache.put, cache_key, result)
+            except Exception as e:
+                print(f"OCR cache write failed: {e}")
+        return result
+
+    async def extract_fields(self, data: bytes, doc_type: str, analyze_result=None, analyze_model_id: str = "prebuilt-document"):
+        """
+        Async counterpart of azure_extraction.extract_fields_with_model; returns the same tuple.
+        """
+        model = MODEL_MAP.get(doc_type, "prebuilt-document")
+        if analyze_result is not None and analyze_model_id == model:
+            result = analyze_result
+        else:
+            result = await self.analyze(data, model)
+        return extract_fields_from_result(result, doc_type)
+
+    async def extract_many(self, items, return_exceptions: bool = True) -> list:
+        """
+        Extracts fields for many (data, doc_type) pairs concurrently, bounded by the analyzer's
+        semaphore and rate limit. Results are in input order; failures are returned as exceptions
+        unless return_exceptions is False.
+        """
+        return await asyncio.gather(
+            *(self.extract_fields(data, doc_type) for data, doc_type in items),
+            return_exceptions=return_exceptions
+        )
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+_default_analyzer = None
+
+def get_async_analyzer() -> AsyncDocumentAnalyzer:
+    """
+    Returns the process-wide analyzer (e.g. for a FastAPI app). Create it and use it from the same
+    event loop; call close_async_analyzer() on shutdown.
+    """
+    global _default_analyzer
+    if _default_analyzer is None:
+        _default_analyzer = AsyncDocumentAnalyzer()
+    return _default_analyzer
+
+async def close_async_analyzer():
+    global _default_analyzer
+    if _default_analyzer is not None:
+        await _default_analyzer.close()
+        _default_analyzer = None
+
+async def analyze_document_async(data: bytes, model_id: str = "prebuilt-document"):
+    return await get_async_analyzer().analyze(data, model_id)
+
+async def extract_fields_with_model_async(data: bytes, doc_type: str, analyze_result=None, analyze_model_id: str = "prebuilt-document"):
+    return await get_async_analyzer().extract_fields(data, doc_type, analyze_result, analyze_model_id)
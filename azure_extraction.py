@@ -1,13 +1,29 @@
 import os
-from azure.ai.formrecognizer import DocumentAnalysisClient
+import json
+import time
+import bisect
+import hashlib
+import tempfile
+import threading
+import requests
+from azure.ai.formrecognizer import DocumentAnalysisClient, AnalyzeResult
 from azure.core.credentials import AzureKeyCredential
 from typing import Tuple, Dict, List
 from difflib import get_close_matches
+from functools import lru_cache
+from field_extractors import FIELD_EXTRACTORS, extract_fields_with_patterns, get_label_fallback_scanner
 
-# Initialize Form Recognizer client
-endpoint = os.getenv("FORM_RECOGNIZER_ENDPOINT")
-key = os.getenv("FORM_RECOGNIZER_KEY")
-fr_client = DocumentAnalysisClient(endpoint=endpoint, credential=AzureKeyCredential(key))
+# Analysis backend (see get_analysis_backend): "azure" calls Form Recognizer, "record" calls it and
+# saves every result as a fixture, "replay" serves saved fixtures without network access
+FORM_RECOGNIZER_BACKEND = os.getenv("FORM_RECOGNIZER_BACKEND", "azure").lower()
+FORM_RECOGNIZER_FIXTURE_DIR = os.getenv("FORM_RECOGNIZER_FIXTURE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests", "fixtures", "analyze_results"))
+FORM_RECOGNIZER_REPLAY_LATENCY_MS = float(os.getenv("FORM_RECOGNIZER_REPLAY_LATENCY_MS", "0"))
+
+# OCR result cache settings (see AnalyzeResultCache)
+OCR_CACHE_ENABLED = os.getenv("OCR_CACHE_ENABLED", "true").lower() == "true"
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", os.path.join(tempfile.gettempdir(), "docupilot_ocr_cache"))
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+OCR_CACHE_TTL_SECONDS = int(os.getenv("OCR_CACHE_TTL_SECONDS", "0"))  # 0 = entries never expire
 
 # Define must-have fields for each doc type
 MUST_HAVE_FIELDS = {
@@ -226,6 +242,72 @@ FIELD_NAME_MAP = {
 def normalize_field_name(name):
     return ''.join(name.lower().split())
 
+class FieldNameResolver:
+    """
+    Maps Form Recognizer field names to canonical names for one doc type: the FIELD_NAME_MAP entry,
+    then the normalized-name map, then a fuzzy match against the must-have fields, else the name
+    without spaces. Resolved names are memoized, so repeat names are a single dict lookup.
+    """
+
+    MAX_RESOLVED = 1024
+
+    def __init__(self, field_map: dict, must_have: list):
+        self.field_map = dict(field_map)
+        self.normalized_map = {}
+        for k, v in field_map.items():
+            self.normalized_map.setdefault(normalize_field_name(k), v)
+        self.must_have = list(must_have)
+        self.must_have_normalized = [normalize_field_name(f) for f in must_have]
+        self._resolved = {}
+        self._fuzzy_match = lru_cache(maxsize=256)(self._fuzzy_match_uncached)
+
+    def _fuzzy_match_uncached(self, norm_name: str):
+        match = get_close_matches(norm_name, self.must_have_normalized, n=1, cutoff=0.8)
+        if match:
+            return self.must_have[self.must_have_normalized.index(match[0])]
+        return None
+
+    def _resolve_uncached(self, name: str):
+        canonical_name = self.field_map.get(name)
+        if canonical_name:
+            return canonical_name, "direct"
+        norm_name = normalize_field_name(name)
+        canonical_name = self.normalized_map.get(norm_name)
+        if canonical_name:
+            return canonical_name, "normalized"
+        canonical_name = self._fuzzy_match(norm_name)
+        if canonical_name:
+            return canonical_name, "fuzzy"
+        return name.replace(" ", ""), "passthrough"
+
+    def resolve(self, name: str) -> str:
+        resolved = self._resolved.get(name)
+        if resolved is None:
+            resolved = self._resolve_uncached(name)
+            if len(self._resolved) < self.MAX_RESOLVED:
+                self._resolved[name] = resolved
+        return resolved[0]
+
+    def resolution_table(self) -> dict:
+        """
+        Every field name resolved so far: {name: {"canonical": ..., "via": direct|normalized|fuzzy|passthrough}}.
+        """
+        return {name: {"canonical": canonical, "via": via} for name, (canonical, via) in dict(self._resolved).items()}
+
+FIELD_NAME_RESOLVERS = {
+    doc_type: FieldNameResolver(FIELD_NAME_MAP.get(doc_type, {}), MUST_HAVE_FIELDS.get(doc_type, []))
+    for doc_type in set(FIELD_NAME_MAP) | set(MUST_HAVE_FIELDS)
+}
+
+def get_field_name_resolver(doc_type: str) -> FieldNameResolver:
+    """
+    Returns the FieldNameResolver for doc_type, creating an empty one for types without a field map.
+    """
+    resolver = FIELD_NAME_RESOLVERS.get(doc_type)
+    if resolver is None:
+        resolver = FIELD_NAME_RESOLVERS.setdefault(doc_type, FieldNameResolver({}, []))
+    return resolver
+
 def to_json_serializable(val):
     # Recursively convert DocumentField, date, datetime, and lists/dicts to JSON-serializable values
     try:
@@ -244,183 +326,553 @@ def to_json_serializable(val):
     else:
         return val
 
+def _json_default(val):
+    # Dates/times inside field values; to_json_serializable produces the same isoformat strings
+    if hasattr(val, "isoformat"):
+        return val.isoformat()
+    return str(val)
+
+class AnalyzeResultCache:
+    """
+    Local disk cache of serialized AnalyzeResults keyed by SHA-256 of the file bytes plus the model id.
+    Size-bounded with least-recently-used eviction (file mtime is the access time) and an optional TTL.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, ttl_seconds: int = 0):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total_bytes = sum(size for _, _, size in self._entries())
+
+    @staticmethod
+    def make_key(data: bytes, model_id: str, pages: str = None) -> str:
+        key = f"{hashlib.sha256(data).hexdigest()}_{model_id}"
+        return f"{key}_p{pages}" if pages else key
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def _entries(self):
+        # (path, last_access, size) for every cached result
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".json"):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((path, st.st_mtime, st.st_size))
+        return entries
+
+    def _remove(self, path: str):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            self._total_bytes -= size
+        except FileNotFoundError:
+            pass
+
+    def get(self, key: str):
+        path = self._path(key)
+        with self._lock:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except FileNotFoundError:
+                self.misses += 1
+                return None
+            except (OSError, ValueError):
+                self._remove(path)
+                self.misses += 1
+                return None
+            if self.ttl_seconds and time.time() - entry.get("cached_at", 0) > self.ttl_seconds:
+                self._remove(path)
+                self.misses += 1
+                return None
+            os.utime(path)  # mark as recently used
+            self.hits += 1
+        return AnalyzeResult.from_dict(entry["result"])
+
+    def put(self, key: str, result):
+        payload = json.dumps({"cached_at": time.time(), "result": result.to_dict()}, default=_json_default)
+        path = self._path(key)
+        with self._lock:
+            self._remove(path)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+            self._total_bytes += os.path.getsize(path)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Drop least recently used entries until the cache fits again
+        for path, _, _ in sorted(self._entries(), key=lambda e: e[1]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            self._remove(path)
+
+    def clear(self):
+        with self._lock:
+            for path, _, _ in self._entries():
+                self._remove(path)
+            self._total_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries()),
+                "bytes": self._total_bytes,
+            }
+
+ocr_cache = AnalyzeResultCache(OCR_CACHE_DIR, OCR_CACHE_MAX_BYTES, OCR_CACHE_TTL_SECONDS) if OCR_CACHE_ENABLED else None
+
+def get_ocr_cache_stats() -> dict:
+    """
+    Returns hit/miss counters and size of the OCR result cache.
+    """
+    if ocr_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **ocr_cache.stats()}
+
+def document_bytes(document) -> bytes:
+    """
+    The content of an in-memory document as bytes: bytes and bytearray are returned as they are,
+    a memoryview over bytes returns the underlying object without copying, file objects are read.
+    """
+    if isinstance(document, (bytes, bytearray)):
+        return document
+    if isinstance(document, memoryview):
+        if isinstance(document.obj, bytes) and document.contiguous and document.nbytes == len(document.obj):
+            return document.obj
+        return document.tobytes()
+    return document.read()
+
+class AzureAnalysisBackend:
+    """
+    Form Recognizer over the network. The client is created on first use, so importing this module
+    needs no credentials.
+    """
+    cacheable = True
+
+    def __init__(self, endpoint: str = None, key: str = None):
+        self.endpoint = endpoint
+        self.key = key
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> DocumentAnalysisClient:
+        with self._lock:
+            if self._client is None:
+                self._client = DocumentAnalysisClient(
+                    endpoint=self.endpoint or os.getenv("FORM_RECOGNIZER_ENDPOINT"),
+                    credential=AzureKeyCredential(self.key or os.getenv("FORM_RECOGNIZER_KEY"))
+                )
+            return self._client
+
+    def analyze(self, data: bytes, model_id: str, pages: str = None):
+        options = {"pages": pages} if pages else {}
+        poller = self.client.begin_analyze_document(model_id, document=data, **options)
+        return poller.result()
+
+
+class MissingFixtureError(LookupError):
+    pass
+
+
+def _fixture_path(fixture_dir: str, key: str) -> str:
+    return os.path.join(fixture_dir, key + ".json")
+
+
+def load_analyze_fixture(path: str) -> dict:
+    """
+    Reads a recorded fixture: {"key", "model_id", "pages", "recorded_at", "result"} with result
+    in AnalyzeResult.to_dict() form.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class RecordingAnalysisBackend:
+    """
+    Passes every analysis through to another backend and saves the result as a fixture file named
+    after the same key as the OCR cache (SHA-256 of the bytes, model id, pages). Bypasses the OCR
+    cache so that every analysis is actually recorded.
+    """
+    cacheable = False
+
+    def __init__(self, inner, fixture_dir: str):
+        self.inner = inner
+        self.fixture_dir = fixture_dir
+        os.makedirs(fixture_dir, exist_ok=True)
+
+    def analyze(self, data: bytes, model_id: str, pages: str = None):
+        result = self.inner.analyze(data, model_id, pages)
+        key = AnalyzeResultCache.make_key(data, model_id, pages)
+        payload = json.dumps(
+            {"key": key, "model_id": model_id, "pages": pages, "recorded_at": time.time(), "result": result.to_dict()},
+            default=_json_default
+        )
+        path = _fixture_path(self.fixture_dir, key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+        print(f"Recorded Form Recognizer fixture {key}")
+        return result
+
+
+class ReplayAnalysisBackend:
+    """
+    Serves recorded fixtures instead of calling Form Recognizer, optionally sleeping latency_seconds
+    per call to imitate the service. Parsed fixtures are kept in memory; every call returns a fresh
+    AnalyzeResult so per-result memoization (text index, table grids) is measured like in production.
+    Unknown documents raise MissingFixtureError.
+    """
+    cacheable = False
+
+    def __init__(self, fixture_dir: str, latency_seconds: float = 0.0):
+        self.fixture_dir = fixture_dir
+        self.latency_seconds = latency_seconds
+        self._fixtures = {}
+        self._lock = threading.Lock()
+
+    def result_for_key(self, key: str):
+        with self._lock:
+            fixture = self._fixtures.get(key)
+        if fixture is None:
+            try:
+                fixture = load_analyze_fixture(_fixture_path(self.fixture_dir, key))
+            except FileNotFoundError:
+                raise MissingFixtureError(f"No recorded Form Recognizer result {key} in {self.fixture_dir}")
+            with self._lock:
+                self._fixtures[key] = fixture
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return AnalyzeResult.from_dict(fixture["result"])
+
+    def analyze(self, data: bytes, model_id: str, pages: str = None):
+        return self.result_for_key(AnalyzeResultCache.make_key(data, model_id, pages))
+
+
+_analysis_backend = None
+_analysis_backend_lock = threading.Lock()
+
+def get_analysis_backend():
+    """
+    The backend analyze_document uses, created on first use from FORM_RECOGNIZER_BACKEND.
+    """
+    global _analysis_backend
+    with _analysis_backend_lock:
+        if _analysis_backend is None:
+            if FORM_RECOGNIZER_BACKEND == "replay":
+                _analysis_backend = ReplayAnalysisBackend(FORM_RECOGNIZER_FIXTURE_DIR, FORM_RECOGNIZER_REPLAY_LATENCY_MS / 1000)
+            elif FORM_RECOGNIZER_BACKEND == "record":
+                _analysis_backend = RecordingAnalysisBackend(AzureAnalysisBackend(), FORM_RECOGNIZER_FIXTURE_DIR)
+            elif FORM_RECOGNIZER_BACKEND == "azure":
+                _analysis_backend = AzureAnalysisBackend()
+            else:
+                raise ValueError(f"Unknown FORM_RECOGNIZER_BACKEND {FORM_RECOGNIZER_BACKEND!r}; use azure, record or replay")
+        return _analysis_backend
+
+def set_analysis_backend(backend):
+    """
+    Replaces the backend, e.g. with a ReplayAnalysisBackend in tests and benchmarks. Any object
+    with analyze(data, model_id, pages) and a cacheable attribute works.
+    """
+    global _analysis_backend
+    with _analysis_backend_lock:
+        _analysis_backend = backend
+
+def analyze_document(document, model_id: str = "prebuilt-document", pages: str = None):
+    """
+    Runs a Form Recognizer model over a document (bytes, memoryview or file object) and returns the AnalyzeResult.
+    pages (e.g. "1-2") limits the analysis to those pages of a PDF.
+    Results are served from the local OCR cache when the same bytes were analyzed with the same model before.
+    """
+    data = document_bytes(document)
+    backend = get_analysis_backend()
+    if ocr_cache is None or not getattr(backend, "cacheable", True):
+        return backend.analyze(data, model_id, pages)
+
+    cache_key = ocr_cache.make_key(data, model_id, pages)
+    result = ocr_cache.get(cache_key)
+    if result is not None:
+        print(f"OCR cache hit for {cache_key}")
+        return result
+    result = backend.analyze(data, model_id, pages)
+    try:
+        ocr_cache.put(cache_key, result)
+    except Exception as e:
+        print(f"OCR cache write failed: {e}")
+    return result
+
+class DocumentTextIndex:
+    """
+    Text view of an AnalyzeResult that is built once and shared by every heuristic extractor:
+    the joined text, its lowercase copy, and each line with its page number and character offset.
+    """
+
+    def __init__(self, result):
+        lines = []
+        line_pages = []
+        line_offsets = []
+        offset = 0
+        for page in getattr(result, "pages", None) or []:
+            for line in page.lines or []:
+                lines.append(line.content)
+                line_pages.append(page.page_number)
+                line_offsets.append(offset)
+                offset += len(line.content) + 1
+        self.lines = lines
+        self.line_pages = line_pages
+        self.line_offsets = line_offsets
+        self.lower_lines = [line.lower() for line in lines]
+        self.text = "\n".join(lines) + "\n" if lines else ""
+        self.lower_text = self.text.lower()
+
+    def line_at(self, offset: int) -> int:
+        """Index of the line containing the character offset into text."""
+        return max(bisect.bisect_right(self.line_offsets, offset) - 1, 0)
+
+    def page_at(self, offset: int):
+        """Page number of the character offset into text, or None for an empty document."""
+        if not self.lines:
+            return None
+        return self.line_pages[self.line_at(offset)]
+
+    def page_text(self, page_number: int) -> str:
+        """Joined text of a single page."""
+        return "\n".join(line for line, page in zip(self.lines, self.line_pages) if page == page_number)
+
+def get_text_index(result) -> DocumentTextIndex:
+    """
+    Returns the DocumentTextIndex for result, building it on first use and keeping it on the result.
+    """
+    text_index = getattr(result, "_text_index", None)
+    if text_index is None:
+        text_index = DocumentTextIndex(result)
+        try:
+            result._text_index = text_index
+        except AttributeError:
+            pass
+    return text_index
+
+class TableGrid:
+    """
+    (row, column) -> cell index over a Form Recognizer DocumentTable, built once per table so
+    neighbouring and header cells are dict lookups instead of rescans of table.cells.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.cells = list(table.cells or [])
+        self.grid = {}
+        self.lower_contents = []
+        self.column_headers = {}
+        for cell in self.cells:
+            self.grid[(cell.row_index, cell.column_index)] = cell
+            self.lower_contents.append((cell.content or "").lower())
+            if getattr(cell, "kind", None) == "columnHeader":
+                self.column_headers.setdefault(cell.column_index, cell)
+
+    def cell_at(self, row: int, column: int):
+        return self.grid.get((row, column))
+
+    def right_of(self, cell):
+        """Cell immediately to the right of cell (after any column span)."""
+        return self.grid.get((cell.row_index, cell.column_index + (cell.column_span or 1)))
+
+    def below(self, cell):
+        """Cell immediately below cell (after any row span)."""
+        return self.grid.get((cell.row_index + (cell.row_span or 1), cell.column_index))
+
+    def header_of(self, cell):
+        """Column header for cell: the columnHeader cell of its column, or the row-0 cell."""
+        header = self.column_headers.get(cell.column_index)
+        if header is None:
+            header = self.grid.get((0, cell.column_index))
+        return header if header is not cell else None
+
+    def is_header(self, cell) -> bool:
+        return getattr(cell, "kind", None) == "columnHeader"
+
+    def find(self, *labels):
+        """Yields every cell whose lowercase content contains one of labels."""
+        for cell, content in zip(self.cells, self.lower_contents):
+            if any(label in content for label in labels):
+                yield cell
+
+    def value_for(self, cell):
+        """
+        Value cell for a label cell: the cell below it when the label is a column header,
+        otherwise the cell to its right.
+        """
+        if self.is_header(cell):
+            return self.below(cell)
+        return self.right_of(cell)
+
+def get_table_grids(result) -> list:
+    """
+    Returns a TableGrid per table of result, building them on first use and keeping them on the result.
+    """
+    table_grids = getattr(result, "_table_grids", None)
+    if table_grids is None:
+        table_grids = [TableGrid(table) for table in getattr(result, "tables", None) or []]
+        try:
+            result._table_grids = table_grids
+        except AttributeError:
+            pass
+    return table_grids
+
 def extract_text_from_blob_url(blob_url: str) -> str:
     """
     Extracts raw text from a document in Azure Blob Storage using the prebuilt-document model.
+    The blob is downloaded so the analysis can be served from the OCR cache.
     """
     try:
-        poller = fr_client.begin_analyze_document_from_url(
-            model_id="prebuilt-document",
-            document_url=blob_url
-        )
-        result = poller.result()
+        response = requests.get(blob_url, timeout=60)
+        response.raise_for_status()
+        result = analyze_document(response.content, "prebuilt-document")
 
-        full_text = ""
-        for page in result.pages:
-            for line in page.lines:
-                full_text += line.content + "\n"
-        return full_text.strip()
+        return get_text_index(result).text.strip()
     except Exception as e:
         print(f"OCR extraction failed: {e}")
         return ""
 
-def extract_bank_fields_from_document(result):
-    import re
-    account_number = None
-    ifsc = None
-    bank_name = None
+def extract_bank_fields_from_document(result, text_index=None, fields=None, sources=None):
+    """
+    Account number, IFSC and bank name from key-value pairs, then tables, then regex. Only the
+    given fields are looked for (all when None); sources, if given, is filled with
+    {field: (source, confidence)}.
+    """
+    wanted = set(fields) if fields is not None else {"AccountNumber", "IFSC", "BankName"}
+    found = {}
 
     # 1. Search key-value pairs
     for kv in getattr(result, "key_value_pairs", []):
         key = kv.key.content.lower().replace(" ", "")
         value = kv.value.content if kv.value else ""
         if "accountnumber" in key or "a/cno" in key or "acno" in key:
-            account_number = value
+            field = "AccountNumber"
         elif "ifsc" in key:
-            ifsc = value
+            field = "IFSC"
         elif "bankname" in key:
-            bank_name = value
-
-    # 2. Search tables
-    for table in getattr(result, "tables", []):
-        for cell in table.cells:
-            cell_text = cell.content.lower()
-            if "account number" in cell_text or "a/c no" in cell_text:
-                row = cell.row_index
-                col = cell.column_index
-                for c in table.cells:
-                    if c.row_index == row and c.column_index == col + 1:
-                        account_number = c.content
-            if "ifsc" in cell_text:
-                row = cell.row_index
-                col = cell.column_index
-                for c in table.cells:
-                    if c.row_index == row and c.column_index == col + 1:
-                        ifsc = c.content
-            if "bank name" in cell_text:
-                row = cell.row_index
-                col = cell.column_index
-                for c in table.cells:
-                    if c.row_index == row and c.column_index == col + 1:
-                        bank_name = c.content
-
-    # 3. Fallback: Search raw text with regex
-    full_text = ""
-    for page in getattr(result, "pages", []):
-        for line in page.lines:
-            full_text += line.content + "\n"
-
-    if not account_number:
-        match = re.search(r"(Account Number|A/C No\.?|A\/C No\.?):?\s*([A-Za-z0-9\-]+)", full_text, re.IGNORECASE)
-        if match:
-            account_number = match.group(2)
-    if not ifsc:
-        match = re.search(r"IFSC\s*[:\-]?\s*([A-Za-z0-9]+)", full_text, re.IGNORECASE)
-        if match:
-            ifsc = match.group(1)
-    if not bank_name:
-        match = re.search(r"Bank Name\s*[:\-]?\s*([A-Za-z0-9\s]+)", full_text, re.IGNORECASE)
-        if match:
-            bank_name = match.group(1).strip()
+            field = "BankName"
+        else:
+            continue
+        if field in wanted:
+            found[field] = (value, "model", getattr(kv, "confidence", None))
+
+    # 2. Search tables: the value is the neighbouring cell of the label cell
+    table_labels = (
+        ("AccountNumber", ("account number", "a/c no")),
+        ("IFSC", ("ifsc",)),
+        ("BankName", ("bank name",)),
+    )
+    for grid in get_table_grids(result):
+        for field, labels in table_labels:
+            if field not in wanted:
+                continue
+            for cell in grid.find(*labels):
+                value_cell = grid.value_for(cell)
+                if value_cell is not None:
+                    found[field] = (value_cell.content, "table", None)
 
+    # 3. Fallback: Search raw text with the registered regex heuristics
+    missing = [field for field in wanted if not (found.get(field) or (None,))[0]]
+    if missing:
+        text_index = text_index or get_text_index(result)
+        regex_fields = extract_fields_with_patterns("Bank Statement", text_index.text, fields=missing, lower_text=text_index.lower_text)
+        for field in missing:
+            if regex_fields.get(field):
+                found[field] = (regex_fields[field], "regex", None)
+
+    if sources is not None:
+        sources.update({field: (source, confidence) for field, (value, source, confidence) in found.items() if value})
     return {
-        "AccountNumber": account_number,
-        "IFSC": ifsc,
-        "BankName": bank_name
+        "AccountNumber": (found.get("AccountNumber") or (None,))[0],
+        "IFSC": (found.get("IFSC") or (None,))[0],
+        "BankName": (found.get("BankName") or (None,))[0]
     }
 
-def extract_itr_fields_from_document(result):
-    import re
-    assessment_year = None
-    pan = None
-    gross_income = None
-    full_text = ""
-    for page in getattr(result, "pages", []):
-        for line in page.lines:
-            full_text += line.content + "\n"
-    match = re.search(r"Assessment Year\s*[:\-]?\s*([0-9\-]+)", full_text, re.IGNORECASE)
-    if match:
-        assessment_year = match.group(1)
-    match = re.search(r"PAN\s*[:\-]?\s*([A-Z0-9]+)", full_text, re.IGNORECASE)
-    if match:
-        pan = match.group(1)
-    match = re.search(r"Gross Income\s*[:\-]?\s*([0-9,]+)", full_text, re.IGNORECASE)
-    if match:
-        gross_income = match.group(1)
+def extract_itr_fields_from_document(result, text_index=None, fields=None):
+    text_index = text_index or get_text_index(result)
+    regex_fields = extract_fields_with_patterns("Income Tax Return", text_index.text, fields=fields, lower_text=text_index.lower_text)
     return {
-        "AssessmentYear": assessment_year,
-        "PAN": pan,
-        "GrossIncome": gross_income
+        "AssessmentYear": regex_fields.get("AssessmentYear"),
+        "PAN": regex_fields.get("PAN"),
+        "GrossIncome": regex_fields.get("GrossIncome")
     }
 
-def extract_credit_report_fields_from_document(result):
-    import re
-    applicant_name = None
-    credit_score = None
-    report_date = None
-    full_text = ""
-    for page in getattr(result, "pages", []):
-        for line in page.lines:
-            full_text += line.content + "\n"
-    # For Name
-    match = re.search(r"(Applicant Name|Name)\s*[:-]?\s*([A-Za-z\s]+)", full_text, re.IGNORECASE)
-    if match:
-        applicant_name = match.group(2).strip()
-
-    # For CIBIL Score and date
-    match = re.search(r"(Credit Score|CIBIL Score)\s*[:-]?\s*([0-9]+)(?:\s*\(As of ([^)]+)\))?", full_text, re.IGNORECASE)
-    if match:
-        credit_score = match.group(2)
-        report_date = match.group(3) if match.group(3) else None
+def extract_credit_report_fields_from_document(result, text_index=None, fields=None):
+    text_index = text_index or get_text_index(result)
+    regex_fields = extract_fields_with_patterns("Credit Report", text_index.text, fields=fields, lower_text=text_index.lower_text)
     return {
-        "ApplicantName": applicant_name,
-        "CreditScore": credit_score,
-        "ReportDate": report_date
+        "ApplicantName": regex_fields.get("ApplicantName"),
+        "CreditScore": regex_fields.get("CreditScore"),
+        "ReportDate": regex_fields.get("ReportDate") or None
     }
 
-def perform_generalized_fallback_extraction(result, must_have, field_map, extracted):
+def extract_id_fields_from_document(result, doc_type, missing_fields, text_index=None):
+    """
+    Regex heuristics for identity documents (PAN Card, Passport), used only for the fields the
+    prebuilt-idDocument model did not return.
+    """
+    text_index = text_index or get_text_index(result)
+    return extract_fields_with_patterns(doc_type, text_index.text, fields=missing_fields, lower_text=text_index.lower_text)
+
+def perform_generalized_fallback_extraction(result, must_have, field_map, extracted, text_index=None, fields=None, sources=None):
     """
     Performs generalized fallback extraction for missing must-have fields using regex and line-based search.
+    fields overrides which fields are searched for (e.g. to include low-confidence ones); sources,
+    if given, records "regex" or "line" for every field found.
     Updates the extracted dictionary in-place.
     """
-    import re
-    
+    missing = list(fields) if fields is not None else [must for must in must_have if not extracted.get(must)]
+    if not missing:
+        return
+    sources = sources if sources is not None else {}
+
     # Get full text from document
-    full_text = ""
-    for page in getattr(result, "pages", []):
-        for line in page.lines:
-            full_text += line.content + "\n"
-    lines = [l.strip() for l in full_text.splitlines()]
-    
-    # Search for missing must-have fields
-    for must in must_have:
-        if not extracted.get(must):
-            label_variations = [k for k, v in field_map.items() if v == must]
-            found = False
-            
-            # Try regex first
-            for label in label_variations:
-                pattern = rf"{label}\s*[:\-]?\s*([A-Za-z0-9 ,./]+)"
-                match = re.search(pattern, full_text, re.IGNORECASE)
-                if match:
-                    extracted[must] = match.group(1).strip()
-                    found = True
-                    break
-            
-            # If not found, try line-based extraction
-            if not found:
-                for i, line in enumerate(lines):
-                    for label in label_variations:
-                        if label.lower() in line.lower():
-                            # Return the next non-empty line as the value
-                            for j in range(i+1, len(lines)):
-                                value = lines[j].strip()
-                                if value:
-                                    extracted[must] = value
-                                    found = True
-                                    break
-                    if found:
+    text_index = text_index or get_text_index(result)
+    lines = text_index.lines
+    lower_lines = text_index.lower_lines
+    scanner = get_label_fallback_scanner(field_map)
+
+    # Try regex first: one scan of the text for all missing fields
+    for must, value in scanner.scan(text_index.text, missing, text_index.lower_text).items():
+        if value:
+            extracted[must] = value
+            sources[must] = "regex"
+
+    # If not found, try line-based extraction
+    for must in missing:
+        if sources.get(must):
+            continue
+        label_variations = scanner.labels.get(must, [])
+        found = False
+        for i, line in enumerate(lower_lines):
+            if any(label in line for label in label_variations):
+                # Return the next non-empty line as the value
+                for j in range(i+1, len(lines)):
+                    value = lines[j].strip()
+                    if value:
+                        extracted[must] = value
+                        sources[must] = "line"
+                        found = True
                         break
+            if found:
+                break
 
 def check_missing_fields_and_completeness(must_have, extracted):
     """
@@ -438,86 +890,168 @@ def check_missing_fields_and_completeness(must_have, extracted):
     is_complete = len(missing_fields) == 0
     return missing_fields, is_complete
 
-def extract_fields_with_model(file_path: str, doc_type: str):
+def extract_fields_with_model(document, doc_type: str, analyze_result=None, analyze_model_id: str = "prebuilt-document"):
     """
     Extracts structured fields from a document using the appropriate model based on doc_type.
+    document is the file content (bytes, memoryview or file object) or, for callers that only have
+    a file on disk, its path.
+    If analyze_result is given (e.g. the OCR result already computed for classification) and it was
+    produced by the same model that doc_type needs, it is reused instead of analyzing the file again.
     Returns a tuple: (extracted_fields_dict, is_complete_bool, missing_fields_list, flagged_by_ai_bool, flagged_reason_str)
     """
+    return _extraction_tuple(extract_field_details_with_model(document, doc_type, analyze_result, analyze_model_id))
+
+def extract_fields_from_result(result, doc_type: str):
+    """
+    Maps the fields of an already-computed AnalyzeResult to the canonical names for doc_type and runs
+    the document-specific heuristics and generalized fallback. Makes no Form Recognizer calls.
+    Returns the same tuple as extract_fields_with_model.
+    """
+    return _extraction_tuple(extract_field_details_from_result(result, doc_type))
+
+def _extraction_tuple(extraction: dict):
+    return (
+        extraction["extracted"], extraction["is_complete"], extraction["missing_fields"],
+        extraction["flagged_by_ai"], extraction["flagged_reason"], extraction["raw_extracted"]
+    )
+
+# Model fields at or above this confidence are kept as they are; heuristics and fallbacks only
+# run for fields that are missing or below it
+EXTRACTION_CONFIDENCE_THRESHOLD = float(os.getenv("EXTRACTION_CONFIDENCE_THRESHOLD", "0.8"))
+
+_stage_stats_lock = threading.Lock()
+_stage_stats = {}
+
+def _record_stage_timings(timings: dict):
+    with _stage_stats_lock:
+        for stage, seconds in timings.items():
+            stats = _stage_stats.setdefault(stage, {"runs": 0, "seconds": 0.0})
+            stats["runs"] += 1
+            stats["seconds"] += seconds
+
+def get_extraction_stage_stats() -> dict:
+    """
+    {stage: {"runs", "seconds", "avg_ms"}} over all extractions; a stage that was skipped because
+    every field it could fill was already confident is not counted.
+    """
+    with _stage_stats_lock:
+        stats = {stage: dict(values) for stage, values in _stage_stats.items()}
+    for values in stats.values():
+        values["avg_ms"] = round(values["seconds"] * 1000 / values["runs"], 2)
+    return stats
+
+def extract_field_details_with_model(document, doc_type: str, analyze_result=None, analyze_model_id: str = "prebuilt-document") -> dict:
+    """
+    extract_fields_with_model, returning the dict of extract_field_details_from_result. Analysis
+    time, when the document had to be analyzed, is included in the timings as "analyze".
+    """
     model = MODEL_MAP.get(doc_type, "prebuilt-document")
+
+    started = time.perf_counter()
+    if analyze_result is not None and analyze_model_id == model:
+        print(f"Reusing {model} result, doc_type={doc_type}")
+        result = analyze_result
+    elif isinstance(document, (str, os.PathLike)):
+        with open(document, "rb") as f:
+            result = analyze_document(f, model)
+    else:
+        result = analyze_document(document, model)
+    analyze_seconds = time.perf_counter() - started
+
+    print(f"Starting extraction, doc_type={doc_type}")
+    extraction = extract_field_details_from_result(result, doc_type)
+    if result is not analyze_result:
+        extraction["timings"] = {"analyze": round(analyze_seconds, 4), **extraction["timings"]}
+        _record_stage_timings({"analyze": analyze_seconds})
+    return extraction
+
+def extract_field_details_from_result(result, doc_type: str) -> dict:
+    """
+    Confidence-driven extraction from an AnalyzeResult. Model fields come first with their
+    confidence; the doc-type heuristics (tables, regex) and the generalized regex/line fallback
+    only run for fields that are missing or below EXTRACTION_CONFIDENCE_THRESHOLD.
+    Returns {"extracted", "is_complete", "missing_fields", "flagged_by_ai", "flagged_reason",
+    "raw_extracted", "field_details", "timings"}; field_details maps each extracted field to
+    {"value", "confidence", "source"} with source one of model, table, regex or line, and timings
+    holds the seconds spent per stage.
+    """
     must_have = MUST_HAVE_FIELDS.get(doc_type, [])
     field_map = FIELD_NAME_MAP.get(doc_type, {})
+    timings = {}
 
-    with open(file_path, "rb") as f:
-        poller = fr_client.begin_analyze_document(model, document=f)
-        result = poller.result()
-
+    text_index = get_text_index(result)
     extracted = {}
     raw_extracted = {}
+    field_details = {}
+
+    def set_field(name, value, source, confidence=None):
+        extracted[name] = value
+        field_details[name] = {"value": value, "confidence": confidence, "source": source}
 
-    print(f"Starting extraction for {file_path}, doc_type={doc_type}")
+    def needs_work(name):
+        detail = field_details.get(name)
+        if detail is None or not extracted.get(name):
+            return True
+        return detail["confidence"] is not None and detail["confidence"] < EXTRACTION_CONFIDENCE_THRESHOLD
 
     # First, extract from Azure Form Recognizer model results
+    started = time.perf_counter()
     if result.documents:
-        must_have_normalized = [normalize_field_name(f) for f in must_have]
+        resolver = get_field_name_resolver(doc_type)
         
         for document in result.documents:
             for name, field in document.fields.items():
                 raw_extracted[name] = to_json_serializable(field.value)
-                # Normalize and map field names
-                norm_name = normalize_field_name(name)
-                # Try direct mapping from model output
-                canonical_name = field_map.get(name)
-                if not canonical_name:
-                    # Try normalized mapping
-                    for k, v in field_map.items():
-                        if normalize_field_name(k) == norm_name:
-                            canonical_name = v
-                            break
-                if not canonical_name:
-                    # Try fuzzy match with must_have fields
-                    match = get_close_matches(norm_name, must_have_normalized, n=1, cutoff=0.8)
-                    if match:
-                        idx = must_have_normalized.index(match[0])
-                        canonical_name = must_have[idx]
-                if not canonical_name:
-                    # Fallback to normalized name if nothing matches
-                    canonical_name = name.replace(" ", "")
-                extracted[canonical_name] = to_json_serializable(field.value)
+                # Map the model's field name to the canonical name (direct, normalized, fuzzy or as-is)
+                canonical_name = resolver.resolve(name)
+                set_field(canonical_name, to_json_serializable(field.value), "model", getattr(field, "confidence", None))
 
         print("Raw extracted fields from Azure model:", raw_extracted)
         print("Final mapped/normalized extracted fields (before post-processing):", extracted)
     else:
         # No documents found, store the full raw text for debugging
-        full_text = ""
-        for page in getattr(result, "pages", []):
-            for line in page.lines:
-                full_text += line.content + "\n"
-        if full_text:
-            raw_extracted["full_text"] = full_text
-
-    # Post-processing: Run document-specific heuristic extraction
-    if doc_type == "Bank Statement":
-        bank_fields = extract_bank_fields_from_document(result)
-        for k, v in bank_fields.items():
-            if v:
-                extracted[k] = v
-    elif doc_type == "Income Tax Return":
-        itr_fields = extract_itr_fields_from_document(result)
-        for k, v in itr_fields.items():
-            if v:
-                extracted[k] = v
-    elif doc_type == "Credit Report":
-        cr_fields = extract_credit_report_fields_from_document(result)
-        for k, v in cr_fields.items():
-            if v:
-                extracted[k] = v
+        if text_index.text:
+            raw_extracted["full_text"] = text_index.text
+    timings["model"] = time.perf_counter() - started
 
-    # Generalized fallback: regex search for missing must-have fields
-    perform_generalized_fallback_extraction(result, must_have, field_map, extracted)
+    # Post-processing: document-specific heuristics, only for fields that are missing or weak
+    heuristic_fields = [name for names in getattr(FIELD_EXTRACTORS.get(doc_type), "fields", []) for name in names]
+    pending = [name for name in heuristic_fields if needs_work(name)]
+    if doc_type in ("PAN Card", "Passport"):
+        pending = [name for name in pending if name in must_have]
+    if pending:
+        started = time.perf_counter()
+        sources = {}
+        if doc_type == "Bank Statement":
+            found = extract_bank_fields_from_document(result, text_index, fields=pending, sources=sources)
+        elif doc_type == "Income Tax Return":
+            found = extract_itr_fields_from_document(result, text_index, fields=pending)
+        elif doc_type == "Credit Report":
+            found = extract_credit_report_fields_from_document(result, text_index, fields=pending)
+        else:
+            found = extract_id_fields_from_document(result, doc_type, pending, text_index)
+        for k, v in found.items():
+            if v and k in pending:
+                source, confidence = sources.get(k, ("regex", None))
+                set_field(k, v, source, confidence)
+        timings["heuristics"] = time.perf_counter() - started
+
+    # Generalized fallback: regex and line search for must-have fields that are missing or weak
+    pending = [must for must in must_have if needs_work(must)]
+    if pending:
+        started = time.perf_counter()
+        fallback = {}
+        sources = {}
+        perform_generalized_fallback_extraction(result, must_have, field_map, fallback, text_index, fields=pending, sources=sources)
+        for k, v in fallback.items():
+            if v:
+                set_field(k, v, sources.get(k, "regex"))
+        timings["fallback"] = time.perf_counter() - started
 
     print("Final mapped/normalized extracted fields (after post-processing):", extracted)
 
     # NOW check for missing fields after all extraction attempts are complete
+    started = time.perf_counter()
     missing_fields, is_complete = check_missing_fields_and_completeness(must_have, extracted)
 
     # Determine flagging status
@@ -536,11 +1070,22 @@ def extract_fields_with_model(file_path: str, doc_type: str):
     else:
         flagged_by_ai = False
         flagged_reason = "All required fields are present. No issues detected by AI."
+    timings["completeness"] = time.perf_counter() - started
 
     # Collect all raw fields for debugging or downstream use
     raw_extracted = dict(extracted)  # or customize as needed
 
-    return extracted, is_complete, missing_fields, flagged_by_ai, flagged_reason, raw_extracted 
+    _record_stage_timings(timings)
+    return {
+        "extracted": extracted,
+        "is_complete": is_complete,
+        "missing_fields": missing_fields,
+        "flagged_by_ai": flagged_by_ai,
+        "flagged_reason": flagged_reason,
+        "raw_extracted": raw_extracted,
+        "field_details": field_details,
+        "timings": {stage: round(seconds, 4) for stage, seconds in timings.items()}
+    }
 
 def is_probable_name(line):
     # Heuristic: two or more uppercase words, not a known label
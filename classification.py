@@ -1,289 +1,584 @@
+import re
 import json
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
 from dotenv import load_dotenv
 load_dotenv()
 from openai import AzureOpenAI
 import os
+import tiktoken
 
 client = AzureOpenAI(
     api_key=os.getenv("CHAT_API_KEY"),
     azure_endpoint=os.getenv("CHAT_ENDPOINT"),
-    api_version="2024-02-15-preview"  # or your required version
+    # Prompt caching (usage.prompt_tokens_details.cached_tokens) needs 2024-10-01-preview or later
+    api_version=os.getenv("CHAT_API_VERSION", "2024-10-21")
 )
 
-def classify_document(text: str) -> dict:
-    system_message = (
-        "You are a document classification expert helping a bank process loan applications. "
-        "Always respond ONLY in valid JSON using the allowed document types."
-    )
+# Only the start of a document is needed to tell its type; the rest is cut off before prompting
+CLASSIFICATION_TOKEN_BUDGET = int(os.getenv("CLASSIFICATION_TOKEN_BUDGET", "1000"))
+
+_encoding = None
+_encoding_error = None
+_token_stats_lock = threading.Lock()
+_token_stats = {"documents": 0, "document_tokens": 0, "sent_tokens": 0, "saved_tokens": 0}
+
+def _get_encoding():
+    global _encoding, _encoding_error
+    if _encoding is None:
+        if _encoding_error is not None:
+            raise _encoding_error
+        try:
+            try:
+                _encoding = tiktoken.encoding_for_model("gpt-4o")
+            except KeyError:
+                _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            # tiktoken downloads its BPE file on first use; don't retry or warn on every call
+            print(f"tiktoken unavailable, approximating token counts: {e}")
+            _encoding_error = e
+            raise
+    return _encoding
+
+def truncate_to_token_budget(text: str, max_tokens: int):
+    """
+    Returns (prefix, document_tokens, prefix_tokens): the longest prefix of text that fits in
+    max_tokens tokens, cut back to the last line break where possible.
+    """
+    try:
+        encoding = _get_encoding()
+    except Exception:
+        # Approximate with ~4 characters per token
+        document_tokens = len(text) // 4
+        if max_tokens <= 0 or document_tokens <= max_tokens:
+            return text, document_tokens, document_tokens
+        return text[:max_tokens * 4], document_tokens, max_tokens
+    tokens = encoding.encode(text, disallowed_special=())
+    if max_tokens <= 0 or len(tokens) <= max_tokens:
+        return text, len(tokens), len(tokens)
+    prefix = encoding.decode(tokens[:max_tokens])
+    last_break = prefix.rfind("\n")
+    if last_break > len(prefix) // 2:
+        prefix = prefix[:last_break]
+    return prefix, len(tokens), len(encoding.encode(prefix, disallowed_special=()))
+
+def get_classification_token_stats() -> dict:
+    """
+    Totals of document tokens seen, sent to the model and saved by truncation since start-up.
+    """
+    with _token_stats_lock:
+        return dict(_token_stats)
+
+# --- LLM prompt ---
+SYSTEM_MESSAGE = (
+    "You are a document classification expert helping a bank process loan applications. "
+    "Always respond ONLY in valid JSON using the allowed document types."
+)
 
-    user_prompt = f"""
-You must classify the following document into one of these types:
-- Aadhaar Card
-- PAN Card
-- Passport
-- VoterID
-- Driving License
-- Salary Slip
-- Form 16
-- Income Tax Return
-- Bank Statement
-- Offer Letter
-- Employment Certificate
-- Employee ID
-- Increment Letter
-- Appraisal Letter
-- Cancelled Cheque
-- Loan Application Form
-- Consent Form
-- FATCA Declaration
-- Proof of Residence
-- Photograph
-- Co-Applicant Document
-- Credit Report
-- Insurance Proof
-- Digital Consent
-- Video KYC
-- Others
+ALLOWED_DOCUMENT_TYPES = [
+    "Aadhaar Card",
+    "PAN Card",
+    "Passport",
+    "VoterID",
+    "Driving License",
+    "Salary Slip",
+    "Form 16",
+    "Income Tax Return",
+    "Bank Statement",
+    "Offer Letter",
+    "Employment Certificate",
+    "Employee ID",
+    "Increment Letter",
+    "Appraisal Letter",
+    "Cancelled Cheque",
+    "Loan Application Form",
+    "Consent Form",
+    "FATCA Declaration",
+    "Proof of Residence",
+    "Photograph",
+    "Co-Applicant Document",
+    "Credit Report",
+    "Insurance Proof",
+    "Digital Consent",
+    "Video KYC",
+    "Others",
+]
+
+# (document text, document_type, reason)
+FEW_SHOT_EXAMPLES = [
+    ("Unique Identification Authority of India\nName: Priya\nAadhaar No: XXXX XXXX XXXX", "Aadhaar Card", "Mentions UIDAI and Aadhaar number"),
+    ("PAN: ACBPP1234D\nIncome Tax Department\nDOB: 10-11-1990", "PAN Card", "Contains PAN number and Income Tax Department details"),
+    ("Passport No: N1234567\nName: Rahul\nExpiry: 2028\nGovernment of India", "Passport", "Mentions Passport number and Government of India"),
+    ("Voter ID: XYZ1234567\nName: Anjali\nElection Commission of India", "VoterID", "Mentions Voter ID and Election Commission of India"),
+    ("DL No: MH12 20190012345\nName: Suresh\nTransport Department", "Driving License", "Mentions Driving License number and Transport Department"),
+    ("Basic: 45,000\nHRA: 15,000\nNet Salary: 75,000\nBank A/C: XXXXXXXX", "Salary Slip", "Mentions salary components and net pay"),
+    ("Form 16\nAssessment Year: 2023-24\nGross Salary: 8,00,000", "Form 16", "Mentions Form 16 and salary details"),
+    ("ITR Acknowledgement\nAssessment Year: 2022-23\nPAN: ABCDE1234F", "Income Tax Return", "Mentions ITR and assessment year"),
+    ("Bank Statement\nAccount Number: XXXXXXXX\nPeriod: Jan-Jun 2023", "Bank Statement", "Mentions bank statement and account details"),
+    ("Offer Letter\nPosition: Analyst\nSalary: 6 LPA", "Offer Letter", "Mentions offer letter and employment details"),
+    ("Employment Certificate\nThis is to certify...", "Employment Certificate", "Mentions employment certificate"),
+    ("Employee ID: 12345\nCompany: ABC Corp", "Employee ID", "Mentions employee ID and company"),
+    ("Increment Letter\nEffective from: April 2023", "Increment Letter", "Mentions increment and effective date"),
+    ("Appraisal Letter\nPerformance: Excellent", "Appraisal Letter", "Mentions appraisal and performance"),
+    ("Cancelled Cheque\nAccount Number: XXXXXXXX", "Cancelled Cheque", "Mentions cancelled cheque and account number"),
+    ("Loan Application Form\nApplicant: Priya\nLoan Amount: 5,00,000", "Loan Application Form", "Mentions loan application and applicant details"),
+    ("Consent Form\nI authorize the bank...", "Consent Form", "Mentions consent for CIBIL check or data access"),
+    ("FATCA Declaration\nNRI Status: Yes", "FATCA Declaration", "Mentions FATCA and NRI status"),
+    ("Electricity Bill\nAddress: 123 Main St", "Proof of Residence", "Mentions proof of residence and address"),
+    ("Photograph\nPassport-size photo", "Photograph", "Mentions passport-size photograph"),
+    ("Co-Applicant: Ramesh\nAadhaar: XXXX XXXX XXXX", "Co-Applicant Document", "Mentions co-applicant and supporting document"),
+    ("CIBIL Report\nScore: 750", "Credit Report", "Mentions CIBIL or credit report"),
+    ("Insurance Policy\nSum Assured: 10,00,000", "Insurance Proof", "Mentions insurance policy and sum assured"),
+    ("Digital Consent\nAadhaar eKYC consent given", "Digital Consent", "Mentions digital consent for eKYC"),
+    ("Video KYC\nGeo-tagged selfie attached", "Video KYC", "Mentions video KYC or geo-tagged selfie"),
+]
+
+def _format_example(document: str, document_type: str, reason: str) -> str:
+    return (
+        f'Document:\n"{document}"\nResponse:\n'
+        f'{{\n  "document_type": "{document_type}",\n  "reason": "{reason}"\n}}\n'
+    )
 
+# The system message carries everything that does not depend on the document: allowed types,
+# instructions for single and batched requests, and the few-shot examples. It is byte-identical
+# on every call, so the provider can serve it from its prompt cache; the document(s) follow in
+# the final user message.
+CLASSIFICATION_SYSTEM_PROMPT = (
+    SYSTEM_MESSAGE
+    + "\n\nYou must classify documents into one of these types:\n"
+    + "".join(f"- {doc_type}\n" for doc_type in ALLOWED_DOCUMENT_TYPES)
+    + """
 Instructions:
 - Only choose one from the above types for "document_type".
 - If uncertain, choose "Others".
 - Provide a concise, factual reason for your classification.
-- Respond ONLY in this JSON format:
-{{
+- For a single document, respond ONLY in this JSON format:
+{
   "document_type": "...",
   "reason": "..."
-}}
+}
+- When several documents are given, each starts with a line "=== DOCUMENT n ===". Classify every
+  document on its own and respond ONLY with a JSON array holding one object per document, in
+  document order:
+[
+  {"document": 1, "document_type": "...", "reason": "..."},
+  {"document": 2, "document_type": "...", "reason": "..."}
+]
 
 --- FEW-SHOT EXAMPLES ---
 
-Document:
-"Unique Identification Authority of India\nName: Priya\nAadhaar No: XXXX XXXX XXXX"
-Response:
-{{
-  "document_type": "Aadhaar Card",
-  "reason": "Mentions UIDAI and Aadhaar number"
-}}
-
-Document:
-"PAN: ACBPP1234D\nIncome Tax Department\nDOB: 10-11-1990"
-Response:
-{{
-  "document_type": "PAN Card",
-  "reason": "Contains PAN number and Income Tax Department details"
-}}
-
-Document:
-"Passport No: N1234567\nName: Rahul\nExpiry: 2028\nGovernment of India"
-Response:
-{{
-  "document_type": "Passport",
-  "reason": "Mentions Passport number and Government of India"
-}}
-
-Document:
-"Voter ID: XYZ1234567\nName: Anjali\nElection Commission of India"
-Response:
-{{
-  "document_type": "VoterID",
-  "reason": "Mentions Voter ID and Election Commission of India"
-}}
-
-Document:
-"DL No: MH12 20190012345\nName: Suresh\nTransport Department"
-Response:
-{{
-  "document_type": "Driving License",
-  "reason": "Mentions Driving License number and Transport Department"
-}}
-
-Document:
-"Basic: 45,000\nHRA: 15,000\nNet Salary: 75,000\nBank A/C: XXXXXXXX"
-Response:
-{{
-  "document_type": "Salary Slip",
-  "reason": "Mentions salary components and net pay"
-}}
-
-Document:
-"Form 16\nAssessment Year: 2023-24\nGross Salary: 8,00,000"
-Response:
-{{
-  "document_type": "Form 16",
-  "reason": "Mentions Form 16 and salary details"
-}}
-
-Document:
-"ITR Acknowledgement\nAssessment Year: 2022-23\nPAN: ABCDE1234F"
-Response:
-{{
-  "document_type": "Income Tax Return",
-  "reason": "Mentions ITR and assessment year"
-}}
-
-Document:
-"Bank Statement\nAccount Number: XXXXXXXX\nPeriod: Jan-Jun 2023"
-Response:
-{{
-  "document_type": "Bank Statement",
-  "reason": "Mentions bank statement and account details"
-}}
-
-Document:
-"Offer Letter\nPosition: Analyst\nSalary: 6 LPA"
-Response:
-{{
-  "document_type": "Offer Letter",
-  "reason": "Mentions offer letter and employment details"
-}}
-
-Document:
-"Employment Certificate\nThis is to certify..."
-Response:
-{{
-  "document_type": "Employment Certificate",
-  "reason": "Mentions employment certificate"
-}}
-
-Document:
-"Employee ID: 12345\nCompany: ABC Corp"
-Response:
-{{
-  "document_type": "Employee ID",
-  "reason": "Mentions employee ID and company"
-}}
-
-Document:
-"Increment Letter\nEffective from: April 2023"
-Response:
-{{
-  "document_type": "Increment Letter",
-  "reason": "Mentions increment and effective date"
-}}
-
-Document:
-"Appraisal Letter\nPerformance: Excellent"
-Response:
-{{
-  "document_type": "Appraisal Letter",
-  "reason": "Mentions appraisal and performance"
-}}
-
-Document:
-"Cancelled Cheque\nAccount Number: XXXXXXXX"
-Response:
-{{
-  "document_type": "Cancelled Cheque",
-  "reason": "Mentions cancelled cheque and account number"
-}}
-
-Document:
-"Loan Application Form\nApplicant: Priya\nLoan Amount: 5,00,000"
-Response:
-{{
-  "document_type": "Loan Application Form",
-  "reason": "Mentions loan application and applicant details"
-}}
-
-Document:
-"Consent Form\nI authorize the bank..."
-Response:
-{{
-  "document_type": "Consent Form",
-  "reason": "Mentions consent for CIBIL check or data access"
-}}
-
-Document:
-"FATCA Declaration\nNRI Status: Yes"
-Response:
-{{
-  "document_type": "FATCA Declaration",
-  "reason": "Mentions FATCA and NRI status"
-}}
-
-Document:
-"Electricity Bill\nAddress: 123 Main St"
-Response:
-{{
-  "document_type": "Proof of Residence",
-  "reason": "Mentions proof of residence and address"
-}}
-
-Document:
-"Photograph\nPassport-size photo"
-Response:
-{{
-  "document_type": "Photograph",
-  "reason": "Mentions passport-size photograph"
-}}
-
-Document:
-"Co-Applicant: Ramesh\nAadhaar: XXXX XXXX XXXX"
-Response:
-{{
-  "document_type": "Co-Applicant Document",
-  "reason": "Mentions co-applicant and supporting document"
-}}
-
-Document:
-"CIBIL Report\nScore: 750"
-Response:
-{{
-  "document_type": "Credit Report",
-  "reason": "Mentions CIBIL or credit report"
-}}
-
-Document:
-"Insurance Policy\nSum Assured: 10,00,000"
-Response:
-{{
-  "document_type": "Insurance Proof",
-  "reason": "Mentions insurance policy and sum assured"
-}}
-
-Document:
-"Digital Consent\nAadhaar eKYC consent given"
-Response:
-{{
-  "document_type": "Digital Consent",
-  "reason": "Mentions digital consent for eKYC"
-}}
-
-Document:
-"Video KYC\nGeo-tagged selfie attached"
-Response:
-{{
-  "document_type": "Video KYC",
-  "reason": "Mentions video KYC or geo-tagged selfie"
-}}
-
---- CLASSIFY THIS DOCUMENT ---
-
-{text}
 """
+    + "\n".join(_format_example(*example) for example in FEW_SHOT_EXAMPLES)
+)
 
+# Start of the final user message
+SINGLE_DOCUMENT_HEADER = "--- CLASSIFY THIS DOCUMENT ---\n\n"
+BATCH_DOCUMENTS_HEADER = "--- CLASSIFY THESE DOCUMENTS ---\n\n"
+
+# Documents classified together in one batched LLM request
+CLASSIFICATION_BATCH_SIZE = int(os.getenv("CLASSIFICATION_BATCH_SIZE", "8"))
+
+# Changes whenever the prompt, allowed types, few-shot examples or deployment change, which
+# invalidates every cached classification made with the old prompt
+CHAT_DEPLOYMENT = "gpt-4o"  # Use your Azure deployment name here
+PROMPT_VERSION = hashlib.sha256(
+    json.dumps([CLASSIFICATION_SYSTEM_PROMPT, SINGLE_DOCUMENT_HEADER, BATCH_DOCUMENTS_HEADER, CHAT_DEPLOYMENT]).encode("utf-8")
+).hexdigest()[:12]
+# Versioned identifier of the stable prompt prefix, logged with every LLM classification
+PROMPT_ID = f"doc-classification-{PROMPT_VERSION}"
+# Also send PROMPT_ID as prompt_cache_key, which routes requests with the same prefix to the same
+# cache; only enable it for API versions/deployments that accept the parameter
+SEND_PROMPT_CACHE_KEY = os.getenv("CLASSIFICATION_SEND_PROMPT_CACHE_KEY", "false").lower() == "true"
+
+_prompt_usage_lock = threading.Lock()
+_prompt_usage = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+
+def _prompt_messages(user_content: str) -> list:
+    return [
+        {"role": "system", "content": CLASSIFICATION_SYSTEM_PROMPT},
+        {"role": "user", "content": user_content}
+    ]
+
+def _create_completion(user_content: str, max_tokens: int):
+    kwargs = {"prompt_cache_key": PROMPT_ID} if SEND_PROMPT_CACHE_KEY else {}
+    response = client.chat.completions.create(
+        model=CHAT_DEPLOYMENT,
+        messages=_prompt_messages(user_content),
+        temperature=0.2,
+        max_tokens=max_tokens,
+        **kwargs
+    )
+    _record_prompt_usage(getattr(response, "usage", None))
+    return response
+
+def _record_prompt_usage(usage):
+    """
+    Adds the token usage of one completion to the running totals. cached_tokens is only reported
+    by API versions with prompt caching (2024-10-01-preview and later) and counts as 0 otherwise.
+    """
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = (getattr(details, "cached_tokens", None) or 0) if details is not None else 0
+    prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+    with _prompt_usage_lock:
+        _prompt_usage["requests"] += 1
+        _prompt_usage["prompt_tokens"] += prompt_tokens
+        _prompt_usage["cached_tokens"] += cached_tokens
+        _prompt_usage["completion_tokens"] += getattr(usage, "completion_tokens", None) or 0
+    print(f"🧾 Classification prompt {PROMPT_ID}: {prompt_tokens} prompt tokens, {cached_tokens} cached")
+
+def get_classification_prompt_usage() -> dict:
+    """
+    Prompt and cached-prefix token totals of all LLM classification requests, to verify that the
+    stable prefix is being served from the provider's prompt cache.
+    """
+    with _prompt_usage_lock:
+        usage = dict(_prompt_usage)
+    usage["prompt_id"] = PROMPT_ID
+    usage["cached_ratio"] = round(usage["cached_tokens"] / usage["prompt_tokens"], 3) if usage["prompt_tokens"] else 0.0
+    return usage
+
+# --- Classification cache ---
+CLASSIFICATION_CACHE_ENABLED = os.getenv("CLASSIFICATION_CACHE_ENABLED", "true").lower() == "true"
+CLASSIFICATION_CACHE_PATH = os.getenv("CLASSIFICATION_CACHE_PATH", os.path.join(tempfile.gettempdir(), "docupilot_classification_cache.sqlite3"))
+CLASSIFICATION_CACHE_TTL_SECONDS = int(os.getenv("CLASSIFICATION_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+CLASSIFICATION_CACHE_MEMORY_SIZE = int(os.getenv("CLASSIFICATION_CACHE_MEMORY_SIZE", "1024"))
+
+class ClassificationCache:
+    """
+    Two-tier cache of LLM classifications keyed by a hash of the whitespace-normalized document
+    text and the prompt version: an in-process LRU in front of a SQLite table with a TTL.
+    Rows written under another prompt version are dropped when the cache is opened.
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: int, memory_size: int, prompt_version: str = PROMPT_VERSION):
+        self.ttl_seconds = ttl_seconds
+        self.memory_size = memory_size
+        self.prompt_version = prompt_version
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS classifications ("
+                "key TEXT PRIMARY KEY, prompt_version TEXT NOT NULL, result TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM classifications WHERE prompt_version != ?", (prompt_version,))
+            if ttl_seconds:
+                self._db.execute("DELETE FROM classifications WHERE created_at < ?", (time.time() - ttl_seconds,))
+
+    def make_key(self, text: str) -> str:
+        normalized = " ".join(text.split())
+        return hashlib.sha256(f"{self.prompt_version}\n{normalized}".encode("utf-8")).hexdigest()
+
+    def _expired(self, created_at: float) -> bool:
+        return bool(self.ttl_seconds) and time.time() - created_at > self.ttl_seconds
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                result, created_at = entry
+                if not self._expired(created_at):
+                    self._memory.move_to_end(key)
+                    self.hits["memory"] += 1
+                    return dict(result)
+                del self._memory[key]
+            row = self._db.execute(
+                "SELECT result, created_at FROM classifications WHERE key = ? AND prompt_version = ?",
+                (key, self.prompt_version)
+            ).fetchone()
+            if row is None or self._expired(row[1]):
+                self.misses += 1
+                return None
+            result = json.loads(row[0])
+            self._remember(key, result, row[1])
+            self.hits["disk"] += 1
+            return dict(result)
+
+    def put(self, key: str, result: dict):
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, result, created_at)
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO classifications (key, prompt_version, result, created_at) VALUES (?, ?, ?, ?)",
+                    (key, self.prompt_version, json.dumps(result), created_at)
+                )
+
+    def _remember(self, key: str, result: dict, created_at: float):
+        # created_at travels with the entry so the TTL applies to memory hits as well
+        self._memory[key] = (dict(result), created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"memory_hits": self.hits["memory"], "disk_hits": self.hits["disk"], "misses": self.misses, "memory_entries": len(self._memory)}
+
+classification_cache = None
+if CLASSIFICATION_CACHE_ENABLED:
+    try:
+        classification_cache = ClassificationCache(CLASSIFICATION_CACHE_PATH, CLASSIFICATION_CACHE_TTL_SECONDS, CLASSIFICATION_CACHE_MEMORY_SIZE)
+    except sqlite3.Error as e:
+        print(f"Classification cache disabled: {e}")
+
+def get_classification_cache_stats() -> dict:
+    if classification_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, "prompt_version": PROMPT_VERSION, **classification_cache.stats()}
+
+# --- Local fast path ---
+# Keyword/regex signals per document type with their weights. A document is classified locally
+# when the best type scores at least FAST_PATH_MIN_SCORE and leads the runner-up by
+# FAST_PATH_MIN_MARGIN; everything else goes to the LLM.
+FAST_PATH_ENABLED = os.getenv("CLASSIFICATION_FAST_PATH", "true").lower() == "true"
+FAST_PATH_MIN_SCORE = float(os.getenv("CLASSIFICATION_FAST_PATH_MIN_SCORE", "0.8"))
+FAST_PATH_MIN_MARGIN = float(os.getenv("CLASSIFICATION_FAST_PATH_MIN_MARGIN", "0.4"))
+
+# Forms and letters quote card numbers and credit terms without being cards or reports; these
+# signals count against every type so such documents go to the LLM
+_FORM_AND_LETTER_SIGNALS = [
+    ("'Application Form'", re.compile(r"application form|loan application", re.IGNORECASE), -0.6),
+    ("consent wording", re.compile(r"consent form|i (hereby )?(authori[sz]e|consent)", re.IGNORECASE), -0.6),
+    ("letter salutation", re.compile(r"dear (sir|madam|applicant)|to whomsoever it may concern", re.IGNORECASE), -0.6),
+    ("letter closing", re.compile(r"yours (faithfully|sincerely|truly)", re.IGNORECASE), -0.6),
+    ("'Subject:' line", re.compile(r"^\s*(subject|sub|re)\s*:", re.IGNORECASE | re.MULTILINE), -0.4),
+]
+
+FAST_PATH_SIGNALS = {
+    "PAN Card": [
+        ("PAN number", re.compile(r"\b[A-Z]{5}[0-9]{4}[A-Z]\b"), 0.4),
+        ("'Permanent Account Number'", re.compile(r"permanent account number", re.IGNORECASE), 0.4),
+        ("'Income Tax Department'", re.compile(r"income tax department", re.IGNORECASE), 0.3),
+        ("'Assessment Year'", re.compile(r"assessment year", re.IGNORECASE), -0.6),
+        ("'Statement'", re.compile(r"statement", re.IGNORECASE), -0.4),
+    ],
+    "Passport": [
+        ("passport MRZ line", re.compile(r"^P<[A-Z]{3}[A-Z<]{5,}", re.MULTILINE), 0.8),
+        ("MRZ document line", re.compile(r"^[A-Z0-9<]{9}[0-9][A-Z]{3}[0-9]{6}[0-9][MF<][0-9]{6}", re.MULTILINE), 0.4),
+        ("'Passport No'", re.compile(r"passport\s*(no|number)", re.IGNORECASE), 0.4),
+        ("'Republic of India'", re.compile(r"republic of india", re.IGNORECASE), 0.2),
+        ("'Place of Issue'", re.compile(r"place of issue", re.IGNORECASE), 0.2),
+        ("'Date of Expiry'", re.compile(r"date of expiry", re.IGNORECASE), 0.2),
+    ],
+    "Income Tax Return": [
+        ("'Assessment Year'", re.compile(r"assessment year", re.IGNORECASE), 0.5),
+        ("ITR form reference", re.compile(r"\bITR[-\s]?(V|[1-7])?\b"), 0.4),
+        ("'Acknowledgement'", re.compile(r"acknowledge?ment", re.IGNORECASE), 0.3),
+        ("'Gross Total Income'", re.compile(r"gross total income", re.IGNORECASE), 0.3),
+        ("'Form 16'", re.compile(r"form\s*16\b", re.IGNORECASE), -0.6),
+    ],
+    "Credit Report": [
+        ("'CIBIL'", re.compile(r"\bcibil\b", re.IGNORECASE), 0.5),
+        ("'Credit Score'", re.compile(r"credit score", re.IGNORECASE), 0.4),
+        ("'Credit Report'", re.compile(r"credit (information )?report", re.IGNORECASE), 0.4),
+        ("credit bureau name", re.compile(r"\b(experian|equifax|crif high ?mark)\b", re.IGNORECASE), 0.4),
+        ("'Consent'", re.compile(r"\bconsent\b", re.IGNORECASE), -0.5),
+    ],
+    "Bank Statement": [
+        ("'Statement of Account'", re.compile(r"(statement of account|account statement|bank statement)", re.IGNORECASE), 0.5),
+        ("'Opening Balance'", re.compile(r"opening balance", re.IGNORECASE), 0.3),
+        ("'Closing Balance'", re.compile(r"closing balance", re.IGNORECASE), 0.3),
+        ("IFSC code", re.compile(r"\bIFSC\b", re.IGNORECASE), 0.2),
+        ("'Withdrawal'/'Deposit' columns", re.compile(r"\b(withdrawals?|deposits?|debit|credit)\b.*\bbalance\b", re.IGNORECASE), 0.2),
+        ("'Salary Slip'", re.compile(r"(salary slip|payslip|net salary)", re.IGNORECASE), -0.6),
+        ("'Cancelled Cheque'", re.compile(r"cancelled cheque", re.IGNORECASE), -0.6),
+    ],
+}
+for _signals in FAST_PATH_SIGNALS.values():
+    _signals.extend(_FORM_AND_LETTER_SIGNALS)
+
+_path_stats_lock = threading.Lock()
+_path_stats = {"rules": 0, "cache": 0, "llm": 0, "llm_batch": 0, "llm_error": 0}
+
+def score_document_types(text: str) -> dict:
+    """
+    Returns {document_type: (score, [matched signal names])} for the fast-path signal table.
+    Scores are capped to [0, 1].
+    """
+    scores = {}
+    for doc_type, signals in FAST_PATH_SIGNALS.items():
+        score = 0.0
+        matched = []
+        for name, pattern, weight in signals:
+            if pattern.search(text):
+                score += weight
+                if weight > 0:
+                    matched.append(name)
+        scores[doc_type] = (min(max(score, 0.0), 1.0), matched)
+    return scores
+
+def fast_classify(text: str):
+    """
+    Classifies text locally from strong keyword/regex signals. Returns a classification dict with a
+    "confidence" score when the best type is clear enough, otherwise None.
+    """
+    scores = score_document_types(text)
+    ranked = sorted(scores.items(), key=lambda item: item[1][0], reverse=True)
+    (best_type, (best_score, matched)), (_, (runner_up_score, _)) = ranked[0], ranked[1]
+    if best_score < FAST_PATH_MIN_SCORE or best_score - runner_up_score < FAST_PATH_MIN_MARGIN:
+        return None
+    return {
+        "document_type": best_type,
+        "reason": f"Matched {', '.join(matched)}",
+        "confidence": round(best_score, 2),
+        "classification_path": "rules"
+    }
+
+def get_classification_path_stats() -> dict:
+    """
+    How many documents were classified by the local rules, from the cache, by a single or batched LLM call, or fell back after an LLM error.
+    """
+    with _path_stats_lock:
+        return dict(_path_stats)
+
+def _truncate_for_classification(text: str, token_budget: int = None):
+    budget = CLASSIFICATION_TOKEN_BUDGET if token_budget is None else token_budget
+    text, document_tokens, sent_tokens = truncate_to_token_budget(text, budget)
+    token_savings = {
+        "document_tokens": document_tokens,
+        "sent_tokens": sent_tokens,
+        "saved_tokens": document_tokens - sent_tokens
+    }
+    with _token_stats_lock:
+        _token_stats["documents"] += 1
+        for k, v in token_savings.items():
+            _token_stats[k] += v
+    if token_savings["saved_tokens"]:
+        print(f"✂️ Classification input truncated: {document_tokens} -> {sent_tokens} tokens")
+    return text, token_savings
+
+def _classify_locally(text: str):
+    """
+    Fast path, then cache. Returns (classification or None, cache key or None).
+    """
+    # Unambiguous documents are classified locally without an LLM round-trip
+    classification = fast_classify(text) if FAST_PATH_ENABLED else None
+    if classification is not None or classification_cache is None:
+        return classification, None
+    cache_key = classification_cache.make_key(text)
+    classification = classification_cache.get(cache_key)
+    if classification is not None:
+        classification["classification_path"] = "cache"
+    return classification, cache_key
+
+def _record_classification(classification: dict, cache_key: str = None) -> dict:
+    if cache_key and classification["classification_path"] in ("llm", "llm_batch"):
+        classification_cache.put(cache_key, classification)
+    with _path_stats_lock:
+        _path_stats[classification["classification_path"]] += 1
+    return classification
+
+def classify_document(text: str, token_budget: int = None) -> dict:
+    text, token_savings = _truncate_for_classification(text, token_budget)
+    classification, cache_key = _classify_locally(text)
+    if classification is None:
+        classification = _classify_with_llm(text)
+    classification["token_savings"] = token_savings
+    return _record_classification(classification, cache_key)
+
+def classify_documents(texts, token_budget: int = None, batch_size: int = None) -> list:
+    """
+    Classifies several documents (e.g. all uploads of one application) and returns their
+    classifications in input order. Documents that the fast path or cache cannot answer are sent
+    to the LLM together, up to batch_size per request, so the instructions and few-shot examples
+    are paid for once per batch instead of once per document. Items of a batch response that are
+    missing or invalid are retried with a single-document call.
+    """
+    batch_size = CLASSIFICATION_BATCH_SIZE if batch_size is None else batch_size
+    classifications = [None] * len(texts)
+    pending = []
+    for i, text in enumerate(texts):
+        text, token_savings = _truncate_for_classification(text, token_budget)
+        classification, cache_key = _classify_locally(text)
+        if classification is None:
+            pending.append((i, text, token_savings, cache_key))
+        else:
+            classification["token_savings"] = token_savings
+            classifications[i] = _record_classification(classification)
+
+    for start in range(0, len(pending), max(1, batch_size)):
+        batch = pending[start:start + max(1, batch_size)]
+        if len(batch) == 1:
+            results = [None]
+        else:
+            results = _classify_batch_with_llm([text for _, text, _, _ in batch])
+        for (i, text, token_savings, cache_key), classification in zip(batch, results):
+            if classification is None:
+                classification = _classify_with_llm(text)
+            classification["token_savings"] = token_savings
+            classifications[i] = _record_classification(classification, cache_key)
+    return classifications
+
+def _parse_model_json(content: str):
+    # Parse cleanly — remove markdown fences or accidental quotes
+    content = content.strip("` \n")
+    if content.startswith("json"):
+        content = content[4:].strip()
+    return json.loads(content)
+
+def _classify_batch_with_llm(texts) -> list:
+    """
+    One chat completion for several documents. Returns a classification per text, or None for
+    every document whose item could not be parsed or names a type that is not allowed.
+    """
+    user_prompt = BATCH_DOCUMENTS_HEADER + "".join(
+        f"=== DOCUMENT {n} ===\n{text}\n\n" for n, text in enumerate(texts, start=1)
+    )
+    results = [None] * len(texts)
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",  # Use your Azure deployment name here
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.2,
-            max_tokens=300
-        )
+        response = _create_completion(user_prompt, max_tokens=150 * len(texts) + 100)
         content = response.choices[0].message.content.strip()
-        print("🔍 RAW MODEL RESPONSE:", content)
+        print("🔍 RAW BATCH MODEL RESPONSE:", content)
+        items = _parse_model_json(content)
+    except Exception as e:
+        print(f"❌ Error in batch classification of {len(texts)} documents, retrying individually:", e)
+        return results
+
+    if not isinstance(items, list):
+        items = [items]
+    for position, item in enumerate(items):
+        if not isinstance(item, dict):
+            continue
+        n = item.get("document", position + 1)
+        if not isinstance(n, int) or not 1 <= n <= len(texts) or results[n - 1] is not None:
+            continue
+        if item.get("document_type") not in ALLOWED_DOCUMENT_TYPES or not isinstance(item.get("reason"), str):
+            continue
+        results[n - 1] = {
+            "document_type": item["document_type"],
+            "reason": item["reason"],
+            "classification_path": "llm_batch"
+        }
+    failed = sum(1 for result in results if result is None)
+    if failed:
+        print(f"⚠️ {failed} of {len(texts)} batch classifications invalid, retrying individually")
+    return results
+
+def _classify_with_llm(text: str) -> dict:
+    user_prompt = SINGLE_DOCUMENT_HEADER + text + "\n"
 
-        # Parse cleanly — remove markdown fences or accidental quotes
-        content = content.strip("` \n")
-        if content.startswith("json"):
-            content = content[4:].strip()
-        return json.loads(content)
+    try:
+        response = _create_completion(user_prompt, max_tokens=300)
+        content = response.choices[0].message.content.strip()
+        print("🔍 RAW MODEL RESPONSE:", content)
+        classification = _parse_model_json(content)
+        classification["classification_path"] = "llm"
+        return classification
 
     except Exception as e:
         print("❌ Error in classification:", e)
         return {
             "document_type": "Others",
-            "reason": f"Classification failed or invalid response: {str(e)}"
+            "reason": f"Classification failed or invalid response: {str(e)}",
+            "classification_path": "llm_error"
         }
@@ -0,0 +1,402 @@
+import os
+import uuid
+import time
+import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from classification import classify_documents
+from azure_extraction import analyze_document, extract_field_details_with_model, extract_field_details_from_result, get_text_index
+from document_quality import assess_document_quality
+from duplicate_detection import compute_fingerprint, confirm_fraud_signals, find_duplicates
+from document_segmentation import PageRangeResult, segment_document, split_pdf, segment_file_name
+from image_preprocessing import preprocess_document, record_preprocessing_stats
+
+# Number of uploaded files processed in parallel. Every stage is a remote call
+# (Form Recognizer, OpenAI, Blob, Cosmos), so threads spend most of their time waiting.
+MAX_WORKERS = int(os.getenv("DOC_PIPELINE_MAX_WORKERS", "5"))
+# If set, classification OCR of PDFs covers only the first N pages. The partial result cannot be
+# reused for extraction, so prebuilt-document types are then analyzed a second time in full,
+# and merged PDFs are not split into their documents.
+CLASSIFICATION_OCR_PAGES = int(os.getenv("CLASSIFICATION_OCR_PAGES", "0"))
+# Parallel block uploads per file, and the BlobServiceClient options that decide when a file is
+# split into blocks: BlobServiceClient.from_connection_string(conn_str, **BLOB_CLIENT_OPTIONS)
+BLOB_UPLOAD_MAX_CONCURRENCY = int(os.getenv("BLOB_UPLOAD_MAX_CONCURRENCY", "4"))
+BLOB_CLIENT_OPTIONS = {
+    "max_single_put_size": int(os.getenv("BLOB_MAX_SINGLE_PUT_MB", "8")) * 1024 * 1024,
+    "max_block_size": int(os.getenv("BLOB_MAX_BLOCK_MB", "4")) * 1024 * 1024,
+}
+
+
+def _analyze_for_classification(file_name: str, file_bytes: bytes) -> dict:
+    """
+    Optional image pre-processing, then OCR for classification. Returns {"text", "reusable_result",
+    "data", "preprocessing", "ocr_seconds"}: reusable_result is the full prebuilt-document result,
+    or None when only the first pages were analyzed; data is what was sent to OCR.
+    """
+    data, preprocessing = preprocess_document(file_name, file_bytes)
+    analysis = {"text": "", "reusable_result": None, "data": data, "preprocessing": preprocessing, "ocr_seconds": 0.0}
+    started = time.perf_counter()
+    try:
+        if CLASSIFICATION_OCR_PAGES and file_name.lower().endswith(".pdf"):
+            result = analyze_document(data, "prebuilt-document", pages=f"1-{CLASSIFICATION_OCR_PAGES}")
+        else:
+            result = analyze_document(data, "prebuilt-document")
+            analysis["reusable_result"] = result
+        analysis["text"] = get_text_index(result).text.strip()
+    except Exception as e:
+        analysis["text"] = f"[OCR failed: {e}]"
+    analysis["ocr_seconds"] = round(time.perf_counter() - started, 3)
+    return analysis
+
+
+def _segment_analysis(file_name: str, file_bytes: bytes, analysis: dict) -> list:
+    """
+    Splits a merged PDF into its logical documents using the full-document analysis. Returns
+    [(segment_file_name, segment_bytes, segment_analysis, classification)] when the PDF holds
+    more than one document, otherwise []. Each segment_analysis carries a PageRangeResult of the
+    original analysis, so segments are extracted without another Form Recognizer call.
+    """
+    result = analysis["reusable_result"]
+    if result is None or not file_name.lower().endswith(".pdf"):
+        return []
+    # Any failure here (segmentation, or PyMuPDF splitting the file) falls back to processing the
+    # PDF as one document instead of failing the whole upload
+    try:
+        segments = segment_document(result)
+        if len(segments) < 2:
+            return []
+
+        page_count = len(result.pages)
+        text_index = get_text_index(result)
+        parts = []
+        for segment in segments:
+            first_page, last_page = segment["first_page"], segment["last_page"]
+            segment_bytes = split_pdf(file_bytes, first_page, last_page)
+            pages = range(first_page, last_page + 1)
+            parts.append((
+                segment_file_name(file_name, first_page, last_page),
+                segment_bytes,
+                {
+                    "text": "\n".join(text_index.page_text(number) for number in pages).strip(),
+                    "reusable_result": PageRangeResult(result, first_page, last_page),
+                    "data": None,
+                    "preprocessing": {"kind": "pdf", "original_bytes": len(segment_bytes), "processed_bytes": len(segment_bytes), "steps": [], "seconds": 0.0},
+                    "ocr_seconds": round(analysis["ocr_seconds"] * len(pages) / page_count, 3),
+                    "segment": {"source_file_name": file_name, "first_page": first_page, "last_page": last_page}
+                },
+                segment["classification"]
+            ))
+    except Exception as e:
+        print(f"Segmentation skipped for {file_name}: {e}")
+        return []
+    print(f"✂️ {file_name} split into {len(parts)} documents: " + ", ".join(f"{name} ({c['document_type']})" for name, _, _, c in parts))
+    return parts
+
+
+def _classification_failed(e: Exception) -> dict:
+    return {
+        "document_type": "Others",
+        "reason": f"Classification failed: {str(e)}"
+    }
+
+
+def _store_document(file_name: str, file_bytes: bytes, analysis: dict, classification: dict, errors: list, applicant_id: str, blob_service_client, blob_container_name: str, cosmos_container, fingerprint: dict = None, duplicates: dict = None) -> dict:
+    """
+    Uploads a classified file to blob storage, extracts its fields and upserts its Cosmos metadata
+    together with the file's duplicate-detection fingerprint. Fraud signals come from duplicates
+    (see find_duplicates): perceptual matches across applicants count only once the extracted
+    fields show a shared identifier.
+    The original file_bytes are uploaded and the (possibly pre-processed) analysis["data"] is used
+    for extraction; neither is written to a temp file.
+    """
+    document_type = classification["document_type"]
+    record_preprocessing_stats(document_type, analysis["preprocessing"], analysis["ocr_seconds"])
+    # Use RAG blob path format: applicant_id/document_type/filename
+    blob_path = f"{applicant_id}/{document_type}/{file_name}"
+    blob_client = blob_service_client.get_blob_client(container=blob_container_name, blob=blob_path)
+    # Large PDFs are uploaded as blocks in parallel (block size is set on the BlobServiceClient)
+    blob_client.upload_blob(file_bytes, overwrite=True, length=len(file_bytes), max_concurrency=BLOB_UPLOAD_MAX_CONCURRENCY)
+
+    try:
+        if analysis.get("segment"):
+            # Part of a merged PDF: extract from its pages of the existing analysis
+            extraction = extract_field_details_from_result(analysis["reusable_result"], document_type)
+        else:
+            extraction = extract_field_details_with_model(
+                analysis["data"],
+                document_type,
+                analyze_result=analysis["reusable_result"],
+                analyze_model_id="prebuilt-document"
+            )
+        extracted_fields = extraction["extracted"]
+        is_complete = extraction["is_complete"]
+        missing_fields = extraction["missing_fields"]
+        flagged_by_ai = extraction["flagged_by_ai"]
+        flagged_reason = extraction["flagged_reason"]
+        field_details = extraction["field_details"]
+        extraction_timings = extraction["timings"]
+    except Exception as e:
+        errors.append(f"❌ Extraction failed for {file_name} ({document_type}): {e}")
+        extracted_fields = {}
+        is_complete = False
+        missing_fields = []
+        flagged_by_ai = True
+        flagged_reason = f"Extraction failed: {str(e)}"
+        field_details = {}
+        extraction_timings = {}
+    fraud_signals = confirm_fraud_signals(duplicates, extracted_fields)
+    similar_uploads = (duplicates or {}).get("similar", [])
+    if fraud_signals:
+        flagged_by_ai = True
+        flagged_reason = "; ".join(filter(None, [flagged_reason, _fraud_reason(fraud_signals)]))
+    metadata = {
+        "id": str(uuid.uuid4()),
+        "applicant_id": applicant_id,
+        "blob_url": blob_client.url,
+        "original_label": file_name,
+        "predicted_classification": document_type,
+        "reasoning": classification["reason"],
+        # How the type was decided (rules, cache, llm, llm_batch, llm_error); confidence is set by the local rules only
+        "classification_path": classification.get("classification_path"),
+        "classification_confidence": classification.get("confidence"),
+        "upload_time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "blob_path": blob_path,
+        "file_name": file_name,
+        "status": "incomplete" if not is_complete else "pending_review",
+        "officer_comments": "",
+        "last_updated": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "reviewed_by": "officer_001",
+        "flagged_by_ai": flagged_by_ai,
+        "flagged_reason": flagged_reason,
+        "extracted_fields": extracted_fields,
+        "field_details": field_details,
+        "extraction_timings": extraction_timings,
+        "is_complete": is_complete,
+        "missing_fields": missing_fields,
+        "raw_extracted_fields": {}, # raw_extracted is no longer returned
+        "fraud_signals": fraud_signals,
+        "similar_uploads": similar_uploads,
+        **(fingerprint or {})
+    }
+    if analysis.get("segment"):
+        metadata["source_file_name"] = analysis["segment"]["source_file_name"]
+        metadata["page_range"] = [analysis["segment"]["first_page"], analysis["segment"]["last_page"]]
+    cosmos_container.upsert_item(metadata)
+    return {
+        "file_name": file_name,
+        "classification": document_type,
+        "reason": classification["reason"],
+        "classification_path": metadata["classification_path"],
+        "classification_confidence": metadata["classification_confidence"],
+        "extracted_text": analysis["text"],
+        "extracted_fields": extracted_fields,
+        "field_details": field_details,
+        "extraction_timings": extraction_timings,
+        "raw_extracted": {}, # raw_extracted is no longer returned
+        "flagged_by_ai": flagged_by_ai,
+        "flagged_reason": flagged_reason,
+        "missing_fields": missing_fields,
+        "preprocessing": analysis["preprocessing"],
+        "ocr_seconds": analysis["ocr_seconds"],
+        "document_id": metadata["id"],
+        "fraud_signals": fraud_signals,
+        "similar_uploads": similar_uploads,
+        "source_file_name": metadata.get("source_file_name"),
+        "page_range": metadata.get("page_range"),
+        "errors": errors
+    }
+
+
+def _fraud_reason(fraud_signals: list) -> str:
+    applicants = sorted({signal["applicant_id"] for signal in fraud_signals})
+    return f"Possible fraud: same document already uploaded for applicant(s) {', '.join(applicants)}"
+
+
+def _reused_result(file_name: str, prior: dict) -> dict:
+    # Same applicant uploaded identical bytes before: reuse that extraction
+    return {
+        "file_name": file_name,
+        "classification": prior.get("predicted_classification", "Others"),
+        "reason": prior.get("reasoning", ""),
+        "classification_path": prior.get("classification_path"),
+        "classification_confidence": prior.get("classification_confidence"),
+        "extracted_text": "",
+        "extracted_fields": prior.get("extracted_fields", {}),
+        "raw_extracted": {},
+        "flagged_by_ai": prior.get("flagged_by_ai", False),
+        "flagged_reason": prior.get("flagged_reason", ""),
+        "missing_fields": prior.get("missing_fields", []),
+        "document_id": prior.get("id"),
+        "duplicate_of": prior.get("id"),
+        "fraud_signals": prior.get("fraud_signals", []),
+        "errors": []
+    }
+
+
+def _rejected_result(file_name: str, quality: dict) -> dict:
+    # Rejected by the local quality gate: nothing was sent to OCR, the LLM, blob storage or Cosmos
+    reason = "; ".join(quality["issues"])
+    return {
+        "file_name": file_name,
+        "classification": "Others",
+        "reason": f"Rejected by quality check: {reason}",
+        "extracted_text": "",
+        "extracted_fields": {},
+        "raw_extracted": {},
+        "flagged_by_ai": True,
+        "flagged_reason": f"Rejected by quality check: {reason}",
+        "missing_fields": [],
+        "rejected": True,
+        "quality": quality["metrics"],
+        "warnings": quality["warnings"],
+        "errors": [f"❌ {file_name} was not processed: {issue}" for issue in quality["issues"]]
+    }
+
+
+def _with_quality(result: dict, quality: dict) -> dict:
+    result["rejected"] = False
+    result["quality"] = quality["metrics"]
+    result["warnings"] = list(quality["warnings"])
+    if result.get("duplicate_of"):
+        result["warnings"].append("Already uploaded for this applicant; the earlier extraction was reused")
+    for similar in result.get("similar_uploads") or []:
+        result["warnings"].append(f"Looks like a re-scan of {similar['file_name']} uploaded earlier; processed as a new document")
+    return result
+
+
+def _check_duplicates(file_name: str, file_bytes: bytes, applicant_id: str, cosmos_container):
+    fingerprint = compute_fingerprint(file_name, file_bytes)
+    return fingerprint, find_duplicates(cosmos_container, applicant_id, fingerprint)
+
+
+def _failed_result(file_name: str, e: Exception) -> dict:
+    # Blob or Cosmos failures are not recoverable per stage; report the file as failed
+    return {
+        "file_name": file_name,
+        "classification": "Others",
+        "reason": f"Processing failed: {str(e)}",
+        "extracted_text": "",
+        "extracted_fields": {},
+        "raw_extracted": {},
+        "flagged_by_ai": True,
+        "flagged_reason": f"Processing failed: {str(e)}",
+        "missing_fields": [],
+        "rejected": False,
+        "warnings": [],
+        "errors": [f"❌ Processing failed for {file_name}: {e}"]
+    }
+
+
+def process_documents(files, applicant_id: str, blob_service_client, blob_container_name: str, cosmos_container, on_complete=None, max_workers: int = MAX_WORKERS) -> list:
+    """
+    Processes all files of an application on a bounded thread pool: the local quality gate runs
+    first and rejected files are reported immediately; files this applicant uploaded before are
+    answered from the earlier extraction; OCR of the remaining files runs
+    concurrently, then all texts are classified together (one batched LLM request for the
+    ambiguous ones), then upload, extraction and the metadata upsert run concurrently.
+    Merged PDFs are split into their logical documents (see document_segmentation), each stored,
+    extracted and returned as a document of its own.
+    files is a list of (file_name, file_bytes) tuples. on_complete(result, done_count, total) is
+    called from the calling thread as each file finishes (once per document of a split PDF), so it
+    may update the UI. Returns the results in the same order as files.
+    """
+    results = [None] * len(files)
+    if not files:
+        return results
+    done_count = 0
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(files)))) as executor:
+        def report(i, result):
+            # result is a list for a merged PDF that was split into several documents
+            nonlocal done_count
+            results[i] = result
+            done_count += 1
+            if on_complete:
+                for part in result if isinstance(result, list) else [result]:
+                    on_complete(part, done_count, len(files))
+
+        qualities = list(executor.map(lambda file: assess_document_quality(*file), files))
+        accepted = []
+        for i, quality in enumerate(qualities):
+            if quality["ok"]:
+                accepted.append(i)
+            else:
+                report(i, _rejected_result(files[i][0], quality))
+
+        # Identical files uploaded earlier by the same applicant reuse that extraction; identical
+        # files within this upload are processed once and the copies reuse the first result
+        checked = dict(zip(accepted, executor.map(
+            lambda i: _check_duplicates(files[i][0], files[i][1], applicant_id, cosmos_container), accepted
+        )))
+        batch_copies = {}
+        first_by_hash = {}
+        to_process = []
+        for i in accepted:
+            fingerprint, duplicates = checked[i]
+            first = first_by_hash.setdefault(fingerprint["content_sha256"], i)
+            if duplicates["reuse"] is not None:
+                report(i, _with_quality(_reused_result(files[i][0], duplicates["reuse"]), qualities[i]))
+            elif first != i:
+                batch_copies[i] = first
+            else:
+                to_process.append(i)
+        accepted = to_process
+
+        analyzed = dict(zip(accepted, executor.map(lambda i: _analyze_for_classification(*files[i]), accepted)))
+        # PDFs whose pages locally match two or more document types are split into their
+        # documents; every other file is classified once, as a whole, below
+        segmented = dict(zip(accepted, executor.map(lambda i: _segment_analysis(*files[i], analyzed[i]), accepted)))
+        whole = [i for i in accepted if not segmented[i]]
+
+        classification_errors = {i: [] for i in whole}
+        try:
+            classifications = dict(zip(whole, classify_documents([analyzed[i]["text"] for i in whole])))
+        except Exception as e:
+            for errors in classification_errors.values():
+                errors.append(f"❌ Error in classification: {e}")
+            classifications = {i: _classification_failed(e) for i in whole}
+
+        futures = {
+            executor.submit(
+                _store_document, files[i][0], files[i][1], analyzed[i], classifications[i],
+                classification_errors[i], applicant_id, blob_service_client, blob_container_name, cosmos_container,
+                checked[i][0], checked[i][1]
+            ): (i, None)
+            for i in whole
+        }
+        parts_by_file = {}
+        for i in accepted:
+            if not segmented[i]:
+                continue
+            parts_by_file[i] = [None] * len(segmented[i])
+            for k, (part_name, part_bytes, part_analysis, classification) in enumerate(segmented[i]):
+                future = executor.submit(
+                    _store_document, part_name, part_bytes, part_analysis, classification,
+                    [], applicant_id, blob_service_client, blob_container_name, cosmos_container,
+                    compute_fingerprint(part_name, part_bytes), checked[i][1]
+                )
+                futures[future] = (i, k)
+        for future in as_completed(futures):
+            i, k = futures[future]
+            name = files[i][0] if k is None else segmented[i][k][0]
+            try:
+                result = _with_quality(future.result(), qualities[i])
+            except Exception as e:
+                result = _failed_result(name, e)
+            if k is None:
+                report(i, result)
+                continue
+            parts_by_file[i][k] = result
+            if all(part is not None for part in parts_by_file[i]):
+                report(i, parts_by_file[i])
+
+    for i, first in batch_copies.items():
+        first_results = results[first] if isinstance(results[first], list) else [results[first]]
+        copies = []
+        for first_result in first_results:
+            if first_result.get("document_id"):
+                copy = dict(first_result, file_name=files[i][0], duplicate_of=first_result["document_id"], errors=[])
+                copies.append(_with_quality(copy, qualities[i]))
+            else:
+                copies.append(dict(first_result, file_name=files[i][0]))
+        report(i, copies if len(copies) > 1 else copies[0])
+    # One entry per logical document: the parts of a split PDF take its place, in page order
+    return [part for result in results for part in (result if isinstance(result, list) else [result])]
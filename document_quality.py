@@ -0,0 +1,142 @@
+import io
+import os
+import fitz  # PyMuPDF
+from PIL import Image, ImageFilter, ImageOps, ImageStat
+from image_preprocessing import IMAGE_EXTENSIONS
+
+# Cheap local checks run before any Form Recognizer or LLM call
+QUALITY_GATE_ENABLED = os.getenv("QUALITY_GATE_ENABLED", "true").lower() == "true"
+# Images whose shorter edge is below this many pixels are rejected; below the warn size they pass with a warning
+QUALITY_MIN_SHORT_EDGE = int(os.getenv("QUALITY_MIN_SHORT_EDGE", "400"))
+QUALITY_WARN_SHORT_EDGE = int(os.getenv("QUALITY_WARN_SHORT_EDGE", "800"))
+# Scanned PDF pages below this effective resolution get a warning
+QUALITY_MIN_DPI = int(os.getenv("QUALITY_MIN_DPI", "100"))
+# Variance of the Laplacian below which an image counts as blurry; blurry uploads are rejected
+# only when QUALITY_REJECT_BLURRY is set, otherwise they pass with a warning
+QUALITY_MIN_SHARPNESS = float(os.getenv("QUALITY_MIN_SHARPNESS", "100"))
+QUALITY_REJECT_BLURRY = os.getenv("QUALITY_REJECT_BLURRY", "false").lower() == "true"
+# A page whose grayscale standard deviation is below this is treated as blank
+QUALITY_BLANK_STDDEV = float(os.getenv("QUALITY_BLANK_STDDEV", "6"))
+# Warn when more than this fraction of a PDF's pages is blank; all-blank documents are rejected
+QUALITY_MAX_BLANK_RATIO = float(os.getenv("QUALITY_MAX_BLANK_RATIO", "0.5"))
+QUALITY_MAX_PAGES = int(os.getenv("QUALITY_MAX_PAGES", "200"))
+# Scanned pages checked for blur/resolution per PDF
+QUALITY_SAMPLE_PAGES = int(os.getenv("QUALITY_SAMPLE_PAGES", "3"))
+
+# Blur and blank checks run on a copy no larger than this, which keeps them fast on phone photos
+_ANALYSIS_MAX_DIMENSION = 1000
+_LAPLACIAN = ImageFilter.Kernel((3, 3), [0, 1, 0, 1, -4, 1, 0, 1, 0], scale=1, offset=128)
+
+
+def _grayscale_sample(image: Image.Image) -> Image.Image:
+    image = ImageOps.grayscale(image)
+    image.thumbnail((_ANALYSIS_MAX_DIMENSION, _ANALYSIS_MAX_DIMENSION))
+    return image
+
+
+def sharpness(image: Image.Image) -> float:
+    """
+    Variance of the Laplacian of a grayscale image; low values mean few edges, i.e. blur.
+    """
+    return ImageStat.Stat(image.filter(_LAPLACIAN)).var[0]
+
+
+def is_blank(image: Image.Image) -> bool:
+    return ImageStat.Stat(image).stddev[0] < QUALITY_BLANK_STDDEV
+
+
+def _check_image(data: bytes, report: dict):
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        width, height = image.size
+        sample = _grayscale_sample(image)
+    report["metrics"].update({"pages": 1, "width": width, "height": height})
+    short_edge = min(width, height)
+    if short_edge < QUALITY_MIN_SHORT_EDGE:
+        report["issues"].append(f"Image resolution too low ({width}x{height}px); please upload a clearer photo or scan")
+    elif short_edge < QUALITY_WARN_SHORT_EDGE:
+        report["warnings"].append(f"Low image resolution ({width}x{height}px); some fields may not be read")
+    if is_blank(sample):
+        report["metrics"]["blank_pages"] = 1
+        report["issues"].append("The image appears to be blank")
+        return
+    _check_sharpness(sample, report, "The image")
+
+
+def _check_sharpness(sample: Image.Image, report: dict, subject: str):
+    value = round(sharpness(sample), 1)
+    report["metrics"]["sharpness"] = min(value, report["metrics"].get("sharpness", value))
+    if value < QUALITY_MIN_SHARPNESS:
+        message = f"{subject} looks blurry (sharpness {value} < {QUALITY_MIN_SHARPNESS:g})"
+        report["issues" if QUALITY_REJECT_BLURRY else "warnings"].append(message)
+
+
+def _check_pdf(data: bytes, report: dict):
+    doc = fitz.open(stream=data, filetype="pdf")
+    try:
+        page_count = doc.page_count
+        report["metrics"]["pages"] = page_count
+        if page_count == 0:
+            report["issues"].append("The PDF has no pages")
+            return
+        if page_count > QUALITY_MAX_PAGES:
+            report["issues"].append(f"The PDF has {page_count} pages; the limit is {QUALITY_MAX_PAGES}")
+            return
+
+        blank_pages = 0
+        sampled = 0
+        for page in doc:
+            if page.get_text("text").strip():
+                continue
+            # No text layer: a scan or an empty page. Blank check on a low-resolution render
+            thumbnail = page.get_pixmap(dpi=36, colorspace=fitz.csGRAY)
+            if is_blank(Image.frombytes("L", (thumbnail.width, thumbnail.height), thumbnail.samples)):
+                blank_pages += 1
+                continue
+            if sampled >= QUALITY_SAMPLE_PAGES:
+                continue
+            sampled += 1
+            images = page.get_images(full=True)
+            if images:
+                rects = page.get_image_rects(images[0][0])
+                if rects and rects[0].width > 0:
+                    dpi = round(images[0][2] / (rects[0].width / 72))
+                    report["metrics"]["min_dpi"] = min(dpi, report["metrics"].get("min_dpi", dpi))
+                    if dpi < QUALITY_MIN_DPI:
+                        report["warnings"].append(f"Page {page.number + 1} is scanned at only {dpi} dpi")
+            render = page.get_pixmap(dpi=100, colorspace=fitz.csGRAY)
+            sample = Image.frombytes("L", (render.width, render.height), render.samples)
+            _check_sharpness(_grayscale_sample(sample), report, f"Page {page.number + 1}")
+
+        report["metrics"]["blank_pages"] = blank_pages
+        if blank_pages == page_count:
+            report["issues"].append("All pages of the PDF appear to be blank")
+        elif blank_pages / page_count > QUALITY_MAX_BLANK_RATIO:
+            report["warnings"].append(f"{blank_pages} of {page_count} pages appear to be blank")
+    finally:
+        doc.close()
+
+
+def assess_document_quality(file_name: str, data: bytes) -> dict:
+    """
+    Local pre-OCR check of an upload: page count, resolution, blur (variance of the Laplacian) and
+    blank pages. Returns {"ok", "issues", "warnings", "metrics"}; ok is False when the document
+    should be rejected before any remote call, with the reasons in issues. Other file types, and
+    files that cannot be opened, are passed through so Form Recognizer can decide.
+    """
+    report = {"ok": True, "issues": [], "warnings": [], "metrics": {"bytes": len(data)}}
+    if not QUALITY_GATE_ENABLED:
+        return report
+    if not data:
+        report["issues"].append("The file is empty")
+    else:
+        try:
+            name = file_name.lower()
+            if name.endswith(".pdf"):
+                _check_pdf(data, report)
+            elif name.endswith(IMAGE_EXTENSIONS):
+                _check_image(data, report)
+        except Exception as e:
+            print(f"Quality check skipped for {file_name}: {e}")
+    report["ok"] = not report["issues"]
+    return report
@@ -0,0 +1,139 @@
+import os
+import fitz  # PyMuPDF
+from azure_extraction import get_text_index
+from classification import fast_classify, score_document_types, classify_documents
+
+# Split merged PDFs (e.g. PAN + passport + bank statement in one file) into logical documents
+SEGMENTATION_ENABLED = os.getenv("SEGMENTATION_ENABLED", "true").lower() == "true"
+# An unclassified page continues the previous document unless another type scores at least this
+# much on it; such pages are sent to the LLM instead
+SEGMENTATION_NEW_DOCUMENT_SCORE = float(os.getenv("SEGMENTATION_NEW_DOCUMENT_SCORE", "0.3"))
+# Pages of one PDF sent to the LLM at most; further undecided pages continue the previous document
+SEGMENTATION_MAX_LLM_PAGES = int(os.getenv("SEGMENTATION_MAX_LLM_PAGES", "6"))
+
+
+def _page_number(item):
+    regions = getattr(item, "bounding_regions", None)
+    if not regions and getattr(item, "key", None) is not None:
+        regions = getattr(item.key, "bounding_regions", None)
+    return regions[0].page_number if regions else None
+
+
+class PageRangeResult:
+    """
+    The part of an AnalyzeResult that lies on pages first_page..last_page: pages, key-value pairs,
+    tables and documents, keeping their original page numbers. It can be passed to
+    azure_extraction.extract_fields_from_result like a full result, so a segment of a merged PDF is
+    extracted without analyzing it again.
+    """
+
+    def __init__(self, result, first_page: int, last_page: int):
+        def in_range(item):
+            page = _page_number(item)
+            return page is not None and first_page <= page <= last_page
+
+        self.model_id = getattr(result, "model_id", None)
+        self.first_page = first_page
+        self.last_page = last_page
+        self.pages = [page for page in getattr(result, "pages", None) or [] if first_page <= page.page_number <= last_page]
+        self.key_value_pairs = [kv for kv in getattr(result, "key_value_pairs", None) or [] if in_range(kv)]
+        self.tables = [table for table in getattr(result, "tables", None) or [] if in_range(table)]
+        self.documents = [document for document in getattr(result, "documents", None) or [] if in_range(document)]
+
+
+def _continues(text: str, previous: dict) -> bool:
+    """
+    Whether an unrecognized page belongs to the previous page's document: no other type scores
+    SEGMENTATION_NEW_DOCUMENT_SCORE or more on it.
+    """
+    scores = score_document_types(text)
+    previous_type = previous["document_type"]
+    return max((score for doc_type, (score, _) in scores.items() if doc_type != previous_type), default=0.0) < SEGMENTATION_NEW_DOCUMENT_SCORE
+
+
+def classify_pages(texts: list, page_numbers: list, fast: list = None) -> list:
+    """
+    One classification per page. Pages the local fast path recognizes are classified from their
+    own text. A page without a clear type continues the previous page's document unless another
+    type scores on it; this is applied again after each LLM round, so LLM-decided pages are
+    continued too. Only the first page of each run of undecided pages goes to the LLM, in one
+    batched request per round and at most SEGMENTATION_MAX_LLM_PAGES pages per PDF; pages still
+    undecided after that continue the previous document.
+    """
+    classifications = list(fast) if fast is not None else [fast_classify(text) for text in texts]
+    llm_pages = 0
+
+    def continue_runs():
+        for i in range(1, len(texts)):
+            if classifications[i] is None and classifications[i - 1] is not None and _continues(texts[i], classifications[i - 1]):
+                classifications[i] = dict(classifications[i - 1], reason=f"Continues page {page_numbers[i - 1]}", classification_path="continuation")
+
+    continue_runs()
+    while None in classifications:
+        heads = [i for i, c in enumerate(classifications) if c is None and (i == 0 or classifications[i - 1] is not None)]
+        heads = heads[:SEGMENTATION_MAX_LLM_PAGES - llm_pages]
+        if not heads:
+            break
+        llm_pages += len(heads)
+        for i, classification in zip(heads, classify_documents([texts[i] for i in heads], batch_size=len(heads))):
+            classifications[i] = classification
+        continue_runs()
+    # Page cap reached: the rest follow the page before them
+    for i, classification in enumerate(classifications):
+        if classification is None:
+            previous = classifications[i - 1] if i else {"document_type": "Others", "reason": ""}
+            classifications[i] = dict(previous, reason=f"Continues page {page_numbers[i - 1]}" if i else "Unclassified", classification_path="continuation")
+    return [dict(classification, page_number=number) for classification, number in zip(classifications, page_numbers)]
+
+
+def segment_document(result) -> list:
+    """
+    Groups consecutive pages of the same type into segments:
+    [{"first_page", "last_page", "document_type", "reason", "classification"}]. Pages are only
+    classified when the local fast path recognizes at least two different document types in the
+    PDF; otherwise, and for single-page results or when segmentation is disabled, the result is
+    an empty list and the file is classified as one document.
+    """
+    if not SEGMENTATION_ENABLED or len(getattr(result, "pages", None) or []) < 2:
+        return []
+    text_index = get_text_index(result)
+    page_numbers = [page.page_number for page in result.pages]
+    texts = [text_index.page_text(number) for number in page_numbers]
+    fast = [fast_classify(text) for text in texts]
+    if len({classification["document_type"] for classification in fast if classification}) < 2:
+        return []
+    segments = []
+    for page in classify_pages(texts, page_numbers, fast):
+        if segments and segments[-1]["document_type"] == page["document_type"]:
+            segments[-1]["last_page"] = page["page_number"]
+            continue
+        segments.append({
+            "first_page": page["page_number"],
+            "last_page": page["page_number"],
+            "document_type": page["document_type"],
+            "reason": page.get("reason", ""),
+            "classification": page
+        })
+    return segments
+
+
+def split_pdf(data: bytes, first_page: int, last_page: int) -> bytes:
+    """
+    A new PDF with pages first_page..last_page (1-based, inclusive) of data. Local only.
+    """
+    source = fitz.open(stream=data, filetype="pdf")
+    try:
+        part = fitz.open()
+        try:
+            part.insert_pdf(source, from_page=first_page - 1, to_page=last_page - 1)
+            return part.tobytes(garbage=3, deflate=True)
+        finally:
+            part.close()
+    finally:
+        source.close()
+
+
+def segment_file_name(file_name: str, first_page: int, last_page: int) -> str:
+    stem, ext = os.path.splitext(file_name)
+    pages = f"p{first_page}" if first_page == last_page else f"p{first_page}-{last_page}"
+    return f"{stem}_{pages}{ext or '.pdf'}"
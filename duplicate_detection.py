@@ -0,0 +1,183 @@
+import io
+import os
+import hashlib
+import fitz  # PyMuPDF
+from PIL import Image, ImageOps
+from image_preprocessing import IMAGE_EXTENSIONS
+
+DUPLICATE_DETECTION_ENABLED = os.getenv("DUPLICATE_DETECTION_ENABLED", "true").lower() == "true"
+# Page-1 hashes at most this many bits apart count as a perceptual match (re-scan or re-photo).
+# A low-resolution dHash mostly captures layout, so documents built from one template (PAN cards,
+# salary slips of one employer) match too: a perceptual match alone never reuses an extraction
+# and never raises a fraud signal. Within an applicant every earlier upload is compared. Across
+# applicants Cosmos finds candidates by exact match on one of eight 8-bit bands of the hash, which
+# is guaranteed to find every hash within 7 bits and most hashes a little further away.
+DUPLICATE_DHASH_MAX_DISTANCE = int(os.getenv("DUPLICATE_DHASH_MAX_DISTANCE", "8"))
+# Cross-applicant candidates fetched from Cosmos per upload
+DUPLICATE_MAX_CANDIDATES = int(os.getenv("DUPLICATE_MAX_CANDIDATES", "50"))
+
+_DHASH_SIZE = 8
+_DHASH_BANDS = 8
+# Extracted fields that identify a person or account; a perceptual match across applicants is a
+# fraud signal only when one of these is equal in both documents
+IDENTIFIER_FIELDS = ("PAN", "DocumentNumber", "AadhaarNumber", "AccountNumber")
+
+
+def difference_hash(image: Image.Image) -> str:
+    """
+    64-bit dHash as 16 hex digits: whether each pixel of a 9x8 grayscale thumbnail is brighter
+    than its right-hand neighbour. Robust to rescaling, recompression and small exposure changes.
+    """
+    small = ImageOps.grayscale(image).resize((_DHASH_SIZE + 1, _DHASH_SIZE), Image.LANCZOS)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(_DHASH_SIZE):
+        for col in range(_DHASH_SIZE):
+            left = pixels[row * (_DHASH_SIZE + 1) + col]
+            right = pixels[row * (_DHASH_SIZE + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:016x}"
+
+
+def hamming_distance(hash_a: str, hash_b: str) -> int:
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count("1")
+
+
+def dhash_bands(dhash: str) -> list:
+    width = len(dhash) // _DHASH_BANDS
+    return [f"{i}:{dhash[i * width:(i + 1) * width]}" for i in range(_DHASH_BANDS)]
+
+
+def compute_fingerprint(file_name: str, data: bytes) -> dict:
+    """
+    {"content_sha256", "page1_dhash", "dhash_bands", "page_count"} for an upload; the perceptual
+    fields are None for files that are neither a PDF nor an image, or cannot be rendered.
+    """
+    fingerprint = {
+        "content_sha256": hashlib.sha256(data).hexdigest(),
+        "page1_dhash": None,
+        "dhash_bands": [],
+        "page_count": None
+    }
+    name = file_name.lower()
+    try:
+        if name.endswith(".pdf"):
+            doc = fitz.open(stream=data, filetype="pdf")
+            try:
+                fingerprint["page_count"] = doc.page_count
+                if doc.page_count:
+                    pixmap = doc[0].get_pixmap(dpi=36, colorspace=fitz.csGRAY)
+                    page = Image.frombytes("L", (pixmap.width, pixmap.height), pixmap.samples)
+                    fingerprint["page1_dhash"] = difference_hash(page)
+            finally:
+                doc.close()
+        elif name.endswith(IMAGE_EXTENSIONS):
+            with Image.open(io.BytesIO(data)) as image:
+                fingerprint["page_count"] = 1
+                fingerprint["page1_dhash"] = difference_hash(ImageOps.exif_transpose(image))
+    except Exception as e:
+        print(f"Perceptual hash skipped for {file_name}: {e}")
+    if fingerprint["page1_dhash"]:
+        fingerprint["dhash_bands"] = dhash_bands(fingerprint["page1_dhash"])
+    return fingerprint
+
+
+def _match_type(fingerprint: dict, item: dict):
+    """
+    "exact" for identical bytes, "perceptual" for a near-identical first page, else None.
+    """
+    if item.get("content_sha256") == fingerprint["content_sha256"]:
+        return "exact", 0
+    if fingerprint["page1_dhash"] and item.get("page1_dhash"):
+        distance = hamming_distance(fingerprint["page1_dhash"], item["page1_dhash"])
+        if distance <= DUPLICATE_DHASH_MAX_DISTANCE:
+            return "perceptual", distance
+    return None, None
+
+
+def find_duplicates(cosmos_container, applicant_id: str, fingerprint: dict) -> dict:
+    """
+    Looks up earlier uploads with the same content hash or a near-identical first page in the
+    document metadata container. Returns:
+      "reuse":            metadata of an earlier upload by the same applicant with identical bytes,
+                          whose extraction can be reused, or None
+      "similar":          the applicant's earlier uploads with a near-identical first page; the new
+                          file is still processed, this only warrants a warning
+      "fraud_signals":    identical files uploaded under other applicants
+      "fraud_candidates": other applicants' uploads with a near-identical first page; they become
+                          fraud signals only if confirm_fraud_signals finds a shared identifier
+    """
+    found = {"reuse": None, "similar": [], "fraud_signals": [], "fraud_candidates": []}
+    if not DUPLICATE_DETECTION_ENABLED:
+        return found
+    try:
+        # The applicant's own uploads are one partition; compare all of them
+        own_items = list(cosmos_container.query_items(
+            query="SELECT * FROM c WHERE c.applicant_id = @applicant_id AND IS_DEFINED(c.content_sha256)",
+            parameters=[{"name": "@applicant_id", "value": applicant_id}],
+            partition_key=applicant_id
+        ))
+        query = (
+            "SELECT TOP @limit c.id, c.applicant_id, c.file_name, c.content_sha256, c.page1_dhash, c.extracted_fields FROM c "
+            "WHERE c.applicant_id != @applicant_id AND (c.content_sha256 = @sha"
+        )
+        params = [
+            {"name": "@limit", "value": DUPLICATE_MAX_CANDIDATES},
+            {"name": "@applicant_id", "value": applicant_id},
+            {"name": "@sha", "value": fingerprint["content_sha256"]}
+        ]
+        if fingerprint["dhash_bands"]:
+            query += " OR EXISTS(SELECT VALUE b FROM b IN c.dhash_bands WHERE ARRAY_CONTAINS(@bands, b))"
+            params.append({"name": "@bands", "value": fingerprint["dhash_bands"]})
+        other_items = list(cosmos_container.query_items(query=query + ")", parameters=params, enable_cross_partition_query=True))
+    except Exception as e:
+        print(f"Duplicate lookup failed: {e}")
+        return found
+
+    for item in own_items:
+        match, distance = _match_type(fingerprint, item)
+        if match == "exact":
+            found["reuse"] = found["reuse"] or item
+        elif match == "perceptual":
+            found["similar"].append({"document_id": item.get("id"), "file_name": item.get("file_name"), "distance": distance})
+    for item in other_items:
+        match, distance = _match_type(fingerprint, item)
+        if match is None:
+            continue
+        signal = {
+            "type": "duplicate_across_applicants",
+            "match": match,
+            "distance": distance,
+            "applicant_id": item.get("applicant_id"),
+            "document_id": item.get("id"),
+            "file_name": item.get("file_name")
+        }
+        if match == "exact":
+            found["fraud_signals"].append(signal)
+        else:
+            found["fraud_candidates"].append(dict(signal, extracted_fields=item.get("extracted_fields") or {}))
+    return found
+
+
+def _normalized_identifier(value) -> str:
+    return "".join(ch for ch in str(value or "") if ch.isalnum()).upper()
+
+
+def confirm_fraud_signals(duplicates: dict, extracted_fields: dict) -> list:
+    """
+    The fraud signals of a new upload once its fields are extracted: identical files under other
+    applicants, plus perceptual matches whose document shares an identifier (PAN, document,
+    Aadhaar or account number) with the new one.
+    """
+    if not duplicates:
+        return []
+    signals = list(duplicates.get("fraud_signals", []))
+    extracted_fields = extracted_fields or {}
+    for candidate in duplicates.get("fraud_candidates", []):
+        for field in IDENTIFIER_FIELDS:
+            value = _normalized_identifier(extracted_fields.get(field))
+            if value and value == _normalized_identifier(candidate["extracted_fields"].get(field)):
+                signal = {key: candidate[key] for key in candidate if key != "extracted_fields"}
+                signals.append(dict(signal, identifier=field))
+                break
+    return signals
@@ -0,0 +1,165 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+# A field pattern is a regex with named groups for the canonical field(s) it fills, plus the
+# literal labels (lowercase) that every match of it starts with. labels=None means the pattern has
+# no fixed label and is searched for on its own.
+FieldPattern = namedtuple("FieldPattern", ["labels", "pattern"])
+
+# Regex heuristics per document type, compiled once at import into a FieldPatternScanner
+FIELD_PATTERNS = {
+    "Bank Statement": [
+        FieldPattern(("account number", "a/c no"), r"(?:Account Number|A/C No\.?|A\/C No\.?):?\s*(?P<AccountNumber>[A-Za-z0-9\-]+)"),
+        FieldPattern(("ifsc",), r"IFSC\s*[:\-]?\s*(?P<IFSC>[A-Za-z0-9]+)"),
+        FieldPattern(("bank name",), r"Bank Name\s*[:\-]?\s*(?P<BankName>[A-Za-z0-9\s]+)"),
+    ],
+    "Income Tax Return": [
+        FieldPattern(("assessment year",), r"Assessment Year\s*[:\-]?\s*(?P<AssessmentYear>[0-9\-]+)"),
+        FieldPattern(("pan",), r"PAN\s*[:\-]?\s*(?P<PAN>[A-Z0-9]+)"),
+        FieldPattern(("gross income",), r"Gross Income\s*[:\-]?\s*(?P<GrossIncome>[0-9,]+)"),
+    ],
+    "Credit Report": [
+        FieldPattern(("applicant name", "name"), r"(?:Applicant Name|Name)\s*[:-]?\s*(?P<ApplicantName>[A-Za-z\s]+)"),
+        FieldPattern(("credit score", "cibil score"), r"(?:Credit Score|CIBIL Score)\s*[:-]?\s*(?P<CreditScore>[0-9]+)(?:\s*\(As of (?P<ReportDate>[^)]+)\))?"),
+    ],
+    "PAN Card": [
+        FieldPattern(None, r"(?-i:\b(?P<DocumentNumber>[A-Z]{5}[0-9]{4}[A-Z])\b)"),
+        FieldPattern(("date of birth", "dob"), r"(?:Date of Birth|DOB)[^0-9\n]{0,20}(?P<DateOfBirth>\d{2}[/\-]\d{2}[/\-]\d{4})"),
+    ],
+    "Passport": [
+        FieldPattern(("passport no", "passport number"), r"(?:Passport No\.?|Passport Number)\s*[:\-]?\s*(?P<DocumentNumber>[A-Z][0-9]{7})"),
+        FieldPattern(("date of birth", "dob"), r"(?:Date of Birth|DOB)[^0-9\n]{0,20}(?P<DateOfBirth>\d{2}[/\-]\d{2}[/\-]\d{4})"),
+        FieldPattern(("date of expiry", "expiry"), r"(?:Date of Expiry|Expiry)[^0-9\n]{0,20}(?P<ExpiryDate>\d{2}[/\-]\d{2}[/\-]\d{4})"),
+    ],
+}
+
+
+class FieldPatternScanner:
+    """
+    Fills several fields in one pass over a text. All pattern labels are combined into one
+    alternation that is scanned over the lowercase text; at each label position the pending field
+    patterns are tried anchored. Each pattern keeps its leftmost match, which is what one
+    re.search per FIELD_PATTERNS entry returns, but the text is scanned once instead of once per
+    field. Label priority is not kept, so the generalized fallback (where the first label in field
+    map order wins) uses LabelFallbackScanner instead.
+    """
+
+    def __init__(self, field_patterns, flags=re.IGNORECASE):
+        self.patterns = [re.compile(fp.pattern, flags) for fp in field_patterns]
+        self.fields = [list(p.groupindex) for p in self.patterns]
+        self.labeled = [fp.labels is not None for fp in field_patterns]
+        labels = sorted({label for fp in field_patterns for label in (fp.labels or ())}, key=len, reverse=True)
+        self.label_re = re.compile("|".join(re.escape(label) for label in labels)) if labels else None
+        self.label_re_ignorecase = re.compile(self.label_re.pattern, re.IGNORECASE) if labels else None
+
+    def scan(self, text: str, fields=None, lower_text: str = None) -> dict:
+        """
+        Returns {field: value} for every field whose pattern matched. If fields is given, only the
+        patterns that can fill one of those fields are searched for. Pass lower_text (e.g. from a
+        DocumentTextIndex) to avoid lowercasing the text again.
+        """
+        pending = [
+            i for i, names in enumerate(self.fields)
+            if fields is None or any(name in fields for name in names)
+        ]
+        found = {}
+        for i in [i for i in pending if not self.labeled[i]]:
+            match = self.patterns[i].search(text)
+            if match:
+                self._store(found, i, match)
+        pending = [i for i in pending if self.labeled[i]]
+        if not pending:
+            return found
+
+        if lower_text is None:
+            lower_text = text.lower()
+        if len(lower_text) == len(text):
+            label_re, haystack = self.label_re, lower_text
+        else:
+            # Some characters change length when lowercased; offsets would not line up
+            label_re, haystack = self.label_re_ignorecase, text
+        pos = 0
+        while pending:
+            label = label_re.search(haystack, pos)
+            if label is None:
+                break
+            start = label.start()
+            still_pending = []
+            for i in pending:
+                match = self.patterns[i].match(text, start)
+                if match is None:
+                    still_pending.append(i)
+                else:
+                    self._store(found, i, match)
+            pending = still_pending
+            # Continue from the next character so labels inside other labels are not skipped
+            pos = start + 1
+        return found
+
+    def _store(self, found, i, match):
+        for name in self.fields[i]:
+            value = match.group(name)
+            found[name] = value.strip() if value else value
+
+
+FIELD_EXTRACTORS = {doc_type: FieldPatternScanner(patterns) for doc_type, patterns in FIELD_PATTERNS.items()}
+
+
+def extract_fields_with_patterns(doc_type: str, text: str, fields=None, lower_text: str = None) -> dict:
+    """
+    Runs the registered regex heuristics for doc_type over text. Returns {} for unknown doc types.
+    """
+    scanner = FIELD_EXTRACTORS.get(doc_type)
+    if scanner is None:
+        return {}
+    return scanner.scan(text, fields, lower_text)
+
+
+class LabelFallbackScanner:
+    """
+    Compiled form of the generalized label fallback for one field map: one "<label> : <value>"
+    pattern per label variation, kept in field map order, plus the lowercase labels for the
+    line-based search. For each field the first label (in map order) that matches anywhere wins,
+    and labels only match as whole words, so "Name" is not found inside "Surname".
+    """
+
+    def __init__(self, field_map_items):
+        self.patterns = {}
+        for label, canonical in field_map_items:
+            self.patterns.setdefault(canonical, []).append((
+                label.lower(),
+                re.compile(rf"(?<![A-Za-z0-9]){re.escape(label)}(?![A-Za-z0-9])\s*[:\-]?\s*([A-Za-z0-9 ,./]+)", re.IGNORECASE)
+            ))
+        self.labels = {field: [label for label, _ in patterns] for field, patterns in self.patterns.items()}
+
+    def scan(self, text: str, fields, lower_text: str = None) -> dict:
+        """
+        Returns {field: value} for the fields whose labels appear in text. Pass lower_text (e.g.
+        from a DocumentTextIndex) to avoid lowercasing the text again; labels absent from it are
+        skipped without running their pattern.
+        """
+        if lower_text is None:
+            lower_text = text.lower()
+        found = {}
+        for field in fields:
+            for label, pattern in self.patterns.get(field, ()):
+                if label not in lower_text:
+                    continue
+                match = pattern.search(text)
+                if match:
+                    found[field] = match.group(1).strip()
+                    break
+        return found
+
+
+@lru_cache(maxsize=64)
+def _label_fallback_scanner(field_map_items) -> LabelFallbackScanner:
+    return LabelFallbackScanner(field_map_items)
+
+
+def get_label_fallback_scanner(field_map: dict) -> LabelFallbackScanner:
+    """
+    Returns the compiled LabelFallbackScanner for field_map, building it once per distinct map.
+    """
+    return _label_fallback_scanner(tuple(field_map.items()))
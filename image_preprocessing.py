@@ -0,0 +1,158 @@
+import io
+import os
+import time
+import threading
+import fitz  # PyMuPDF
+from PIL import Image, ImageOps
+
+# Shrinks phone photos and image-only PDFs before they are sent to Form Recognizer. Off by default;
+# the limits below are floors/caps chosen to keep text legible for OCR.
+IMAGE_PREPROCESSING_ENABLED = os.getenv("IMAGE_PREPROCESSING_ENABLED", "false").lower() == "true"
+# Longest edge of an uploaded image after resizing
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "2500"))
+# Quality floor: an image is never scaled so that its shorter edge falls below this
+IMAGE_MIN_SHORT_EDGE = int(os.getenv("IMAGE_MIN_SHORT_EDGE", "1000"))
+IMAGE_GRAYSCALE = os.getenv("IMAGE_GRAYSCALE", "true").lower() == "true"
+# JPEG quality for recompression; values below the floor are raised to it
+IMAGE_JPEG_QUALITY = max(int(os.getenv("IMAGE_JPEG_QUALITY", "80")), 60)
+# Embedded PDF images above PDF_IMAGE_MAX_DPI are resampled down to it, never below PDF_IMAGE_MIN_DPI
+PDF_IMAGE_MAX_DPI = int(os.getenv("PDF_IMAGE_MAX_DPI", "200"))
+PDF_IMAGE_MIN_DPI = int(os.getenv("PDF_IMAGE_MIN_DPI", "150"))
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+
+
+def _prepare_image(image: Image.Image, scale: float) -> Image.Image:
+    if scale < 1:
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(size, Image.LANCZOS)
+    if IMAGE_GRAYSCALE and image.mode != "L":
+        image = ImageOps.grayscale(image)
+    elif image.mode not in ("L", "RGB"):
+        image = image.convert("RGB")
+    return image
+
+
+def _encode(image: Image.Image, image_format: str) -> bytes:
+    out = io.BytesIO()
+    if image_format == "PNG":
+        image.save(out, format="PNG", optimize=True)
+    else:
+        image.save(out, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+    return out.getvalue()
+
+
+def preprocess_image(data: bytes):
+    """
+    Caps the resolution of a photo/scan, converts it to grayscale and recompresses it in its own
+    format (PNG stays lossless, everything else becomes JPEG). Multi-frame images (multi-page
+    TIFFs) are returned untouched, since re-encoding would keep only the first page. Returns
+    (bytes, steps applied).
+    """
+    with Image.open(io.BytesIO(data)) as original:
+        if getattr(original, "n_frames", 1) > 1:
+            return data, []
+        image_format = "PNG" if original.format == "PNG" else "JPEG"
+        image = ImageOps.exif_transpose(original)
+        long_edge, short_edge = max(image.size), min(image.size)
+        scale = min(1.0, max(IMAGE_MAX_DIMENSION / long_edge, IMAGE_MIN_SHORT_EDGE / short_edge))
+        steps = []
+        if scale < 1:
+            steps.append(f"resized {image.width}x{image.height} by {scale:.2f}")
+        if IMAGE_GRAYSCALE and image.mode != "L":
+            steps.append("grayscale")
+        steps.append(f"{image_format.lower()} recompressed")
+        return _encode(_prepare_image(image, scale), image_format), steps
+
+
+def preprocess_pdf(data: bytes):
+    """
+    Downsamples embedded raster images (scanned pages) whose effective resolution exceeds
+    PDF_IMAGE_MAX_DPI and re-saves the PDF with garbage collection and deflate. Text-only PDFs are
+    returned untouched. Returns (bytes, steps applied).
+    """
+    doc = fitz.open(stream=data, filetype="pdf")
+    try:
+        resampled = 0
+        seen = set()
+        for page in doc:
+            for image_info in page.get_images(full=True):
+                xref, width, height = image_info[0], image_info[2], image_info[3]
+                if xref in seen:
+                    continue
+                seen.add(xref)
+                rects = page.get_image_rects(xref)
+                if not rects or rects[0].width <= 0:
+                    continue
+                dpi = width / (rects[0].width / 72)
+                if dpi <= PDF_IMAGE_MAX_DPI:
+                    continue
+                scale = max(PDF_IMAGE_MAX_DPI, PDF_IMAGE_MIN_DPI) / dpi
+                with Image.open(io.BytesIO(doc.extract_image(xref)["image"])) as image:
+                    image.load()
+                    jpeg = _encode(_prepare_image(image, scale), "JPEG")
+                page.replace_image(xref, stream=jpeg)
+                resampled += 1
+        if not resampled:
+            return data, []
+        return doc.tobytes(garbage=3, deflate=True), [f"{resampled} page image(s) resampled to {PDF_IMAGE_MAX_DPI} dpi"]
+    finally:
+        doc.close()
+
+
+def preprocess_document(file_name: str, data: bytes, enabled: bool = None):
+    """
+    Shrinks an upload before OCR. Returns (bytes to analyze, report); the report holds the
+    before/after sizes, the steps applied and the time spent. The original bytes are returned
+    whenever pre-processing is disabled, fails, or would not make the file smaller.
+    """
+    enabled = IMAGE_PREPROCESSING_ENABLED if enabled is None else enabled
+    name = file_name.lower()
+    kind = "pdf" if name.endswith(".pdf") else "image" if name.endswith(IMAGE_EXTENSIONS) else "other"
+    report = {"kind": kind, "original_bytes": len(data), "processed_bytes": len(data), "steps": [], "seconds": 0.0}
+    if not enabled or kind == "other":
+        return data, report
+
+    started = time.perf_counter()
+    try:
+        processed, steps = preprocess_pdf(data) if kind == "pdf" else preprocess_image(data)
+    except Exception as e:
+        print(f"Pre-processing skipped for {file_name}: {e}")
+        processed, steps = data, []
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    if len(processed) < len(data):
+        report["processed_bytes"] = len(processed)
+        report["steps"] = steps
+        print(f"🗜️ {file_name}: {len(data):,} -> {len(processed):,} bytes ({', '.join(steps)})")
+        return processed, report
+    return data, report
+
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+def record_preprocessing_stats(doc_type: str, report: dict, ocr_seconds: float):
+    """
+    Adds one document's sizes and OCR latency to the per-document-type totals.
+    """
+    with _stats_lock:
+        stats = _stats.setdefault(doc_type, {
+            "documents": 0, "original_bytes": 0, "processed_bytes": 0,
+            "preprocessing_seconds": 0.0, "ocr_seconds": 0.0
+        })
+        stats["documents"] += 1
+        stats["original_bytes"] += report["original_bytes"]
+        stats["processed_bytes"] += report["processed_bytes"]
+        stats["preprocessing_seconds"] += report["seconds"]
+        stats["ocr_seconds"] += ocr_seconds
+
+def get_preprocessing_stats() -> dict:
+    """
+    {doc_type: totals} with the size reduction and average OCR latency, for tuning the limits.
+    """
+    with _stats_lock:
+        stats = {doc_type: dict(values) for doc_type, values in _stats.items()}
+    for values in stats.values():
+        values["size_ratio"] = round(values["processed_bytes"] / values["original_bytes"], 3) if values["original_bytes"] else 1.0
+        values["avg_ocr_seconds"] = round(values["ocr_seconds"] / values["documents"], 3)
+    return stats
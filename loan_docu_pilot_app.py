@@ -7,11 +7,7 @@ import streamlit as st
 from PyPDF2 import PdfReader # This import is not used in the provided code, can be removed if not needed elsewhere.
 from azure.storage.blob import BlobServiceClient
 from azure.cosmos import CosmosClient, PartitionKey
-from azure.ai.formrecognizer import DocumentAnalysisClient
-from azure.core.credentials import AzureKeyCredential
-from classification import classify_document
-from azure_extraction import extract_text_from_blob_url, extract_fields_with_model
-import tempfile
+from document_pipeline import process_documents, BLOB_CLIENT_OPTIONS
 from streamlit_lottie import st_lottie
 import re
 
@@ -20,15 +16,9 @@ load_dotenv()
 BLOB_CONN_STR = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
 COSMOS_ENDPOINT = os.getenv("COSMOS_ENDPOINT")
 COSMOS_KEY = os.getenv("COSMOS_KEY")
-FORM_RECOGNIZER_KEY = os.getenv("FORM_RECOGNIZER_KEY")
-FORM_RECOGNIZER_ENDPOINT = os.getenv("FORM_RECOGNIZER_ENDPOINT")
 
 # Azure Clients Initialization
-blob_service_client = BlobServiceClient.from_connection_string(BLOB_CONN_STR)
-form_recognizer = DocumentAnalysisClient(
-    endpoint=FORM_RECOGNIZER_ENDPOINT,
-    credential=AzureKeyCredential(FORM_RECOGNIZER_KEY)
-)
+blob_service_client = BlobServiceClient.from_connection_string(BLOB_CONN_STR, **BLOB_CLIENT_OPTIONS)
 cosmos_client = CosmosClient(COSMOS_ENDPOINT, COSMOS_KEY)
 database = cosmos_client.create_database_if_not_exists(id="LoanApplicationDB")
 container = database.create_container_if_not_exists(
@@ -449,79 +439,31 @@ if page == "Upload Documents":
         )
         st.markdown('</div>', unsafe_allow_html=True) # End of Processing card
 
-        extraction_results = []
-        for file_obj in uploaded_files:
-            temp_dir = tempfile.gettempdir()
-            temp_path = os.path.join(temp_dir, file_obj.name)
-            file_obj.seek(0)
-            with open(temp_path, "wb") as temp_file:
-                temp_file.write(file_obj.getbuffer())
-            file_obj.seek(0)
-            text = ""
-            try:
-                poller = form_recognizer.begin_analyze_document("prebuilt-document", file_obj)
-                result = poller.result()
-                lines = [line.content for page in result.pages for line in page.lines]
-                text = "\n".join(lines)
-            except Exception as e:
-                text = f"[OCR failed: {e}]"
-            try:
-                classification = classify_document(text)
-            except Exception as e:
-                st.error(f"❌ Error in classification: {e}")
-                classification = {
-                    "document_type": "Others",
-                    "reason": f"Classification failed: {str(e)}"
-                }
-            document_type = classification["document_type"]
-            # Use RAG blob path format: applicant_id/document_type/filename
-            blob_path = f"{applicant_id}/{document_type}/{file_obj.name}"
-            blob_client = blob_service_client.get_blob_client(container=BLOB_CONTAINER_NAME, blob=blob_path)
-            file_obj.seek(0) # Reset file pointer before upload
-            blob_client.upload_blob(file_obj, overwrite=True)
-            
-            try:
-                extracted_fields, is_complete, missing_fields, flagged_by_ai, flagged_reason, raw_extracted = extract_fields_with_model(temp_path, classification["document_type"])
-            except Exception as e:
-                st.error(f"❌ Extraction failed for {file_obj.name} ({classification['document_type']}): {e}")
-                extracted_fields = {}
-                is_complete = False
-                missing_fields = []
-                flagged_by_ai = True
-                flagged_reason = f"Extraction failed: {str(e)}"
-            metadata = {
-                "id": str(uuid.uuid4()),
-                "applicant_id": applicant_id,
-                "blob_url": blob_client.url,
-                "original_label": file_obj.name,
-                "predicted_classification": classification["document_type"],
-                "reasoning": classification["reason"],
-                "upload_time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
-                "blob_path": blob_path,
-                "file_name": file_obj.name,
-                "status": "incomplete" if not is_complete else "pending_review",
-                "officer_comments": "",
-                "last_updated": datetime.datetime.now(datetime.timezone.utc).isoformat(),
-                "reviewed_by": "officer_001",
-                "flagged_by_ai": flagged_by_ai,
-                "flagged_reason": flagged_reason,
-                "extracted_fields": extracted_fields,
-                "is_complete": is_complete,
-                "missing_fields": missing_fields,
-                "raw_extracted_fields": {} # raw_extracted is no longer returned
-            }
-            container.upsert_item(metadata)
-            extraction_results.append({
-                "file_name": file_obj.name,
-                "classification": classification["document_type"],
-                "reason": classification["reason"],
-                "extracted_text": text,
-                "extracted_fields": extracted_fields,
-                "raw_extracted": {}, # raw_extracted is no longer returned
-                "flagged_by_ai": flagged_by_ai,
-                "flagged_reason": flagged_reason,
-                "missing_fields": missing_fields
-            })
+        # Process all files in parallel; progress is reported as each one finishes
+        progress_bar = st.progress(0.0)
+        progress_text = st.empty()
+
+        def report_progress(result, done_count, total):
+            for error in result["errors"]:
+                st.error(error)
+            for warning in result.get("warnings", []):
+                st.warning(f"⚠️ {result['file_name']}: {warning}")
+            progress_bar.progress(done_count / total)
+            if result.get("rejected"):
+                progress_text.markdown(f"❌ {result['file_name']} rejected, please re-upload ({done_count}/{total})")
+            else:
+                progress_text.markdown(f"✅ {result['file_name']} processed ({done_count}/{total})")
+
+        # One immutable bytes copy per upload, shared by OCR, blob upload and extraction; nothing is written to disk
+        files = [(file_obj.name, file_obj.getvalue()) for file_obj in uploaded_files]
+        extraction_results = process_documents(
+            files,
+            applicant_id,
+            blob_service_client,
+            BLOB_CONTAINER_NAME,
+            container,
+            on_complete=report_progress
+        )
         st.session_state["extraction_results"] = extraction_results
         st.session_state["processing"] = False
         st.balloons()
@@ -0,0 +1,203 @@
+import os
+import re
+import logging
+import tiktoken
+
+# Chunk size in tokens of the embedding model's encoding (text-embedding-ada-002 uses cl100k_base)
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "512"))
+# Tokens of trailing sentences/paragraphs repeated at the start of the next chunk
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "64"))
+CHUNK_ENCODING = os.getenv("CHUNK_ENCODING", "cl100k_base")
+
+# Pages are joined with a blank line, so a page break is also a paragraph break
+PAGE_SEPARATOR = "\n\n"
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+_LINE_BREAK = re.compile(r"\n")
+_WORD = re.compile(r"\S+")
+_encoding = None
+_encoding_error = None
+
+
+def _get_encoding():
+    global _encoding, _encoding_error
+    if _encoding is None:
+        if _encoding_error is not None:
+            raise _encoding_error
+        try:
+            _encoding = tiktoken.get_encoding(CHUNK_ENCODING)
+        except Exception as e:
+            # tiktoken downloads its BPE file on first use; don't retry it for every span
+            logging.warning(f"tiktoken unavailable, approximating token counts: {e}")
+            _encoding_error = e
+            raise
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    try:
+        return len(_get_encoding().encode(text, disallowed_special=()))
+    except Exception:
+        # Approximate with ~4 characters per token
+        return (len(text) + 3) // 4
+
+
+def document_text(pages: list) -> str:
+    """
+    The text that chunk character offsets refer to: the page texts joined by PAGE_SEPARATOR.
+    """
+    return PAGE_SEPARATOR.join(pages)
+
+
+def _split(text: str, start: int, end: int, pattern) -> list:
+    """
+    Non-empty (start, end) spans of text[start:end] between matches of pattern, with surrounding
+    whitespace trimmed.
+    """
+    spans = []
+    position = start
+    for match in list(pattern.finditer(text, start, end)) + [None]:
+        piece_end = match.start() if match else end
+        piece = text[position:piece_end]
+        stripped = piece.strip()
+        if stripped:
+            piece_start = position + piece.index(stripped[0])
+            spans.append((piece_start, piece_start + len(stripped)))
+        if match:
+            position = match.end()
+    return spans
+
+
+def _split_words(text: str, start: int, end: int, max_tokens: int) -> list:
+    """
+    Greedy runs of whole words under max_tokens; a single word longer than that is cut by length.
+    """
+    spans = []
+    run_start = run_end = None
+    run_tokens = 0
+    for match in _WORD.finditer(text, start, end):
+        word_start, word_end = match.span()
+        tokens = count_tokens(match.group())
+        if tokens > max_tokens:
+            if run_start is not None:
+                spans.append((run_start, run_end))
+                run_start = None
+            step = max(1, max_tokens * 2)
+            spans.extend((i, min(i + step, word_end)) for i in range(word_start, word_end, step))
+            continue
+        if run_start is not None and run_tokens + tokens > max_tokens:
+            spans.append((run_start, run_end))
+            run_start = None
+        if run_start is None:
+            run_start, run_tokens = word_start, 0
+        run_end = word_end
+        run_tokens += tokens
+    if run_start is not None:
+        spans.append((run_start, run_end))
+    return spans
+
+
+def _units(text: str, start: int, end: int, page: int, max_tokens: int) -> list:
+    """
+    Splits one page into sentences, breaking sentences longer than max_tokens at lines (keeps
+    table rows whole) and then words. Returns [(start, end, page, tokens, opens_paragraph)].
+    """
+    units = []
+
+    def add(span_start, span_end, opens, level):
+        tokens = count_tokens(text[span_start:span_end])
+        if tokens <= max_tokens or level > 1:
+            units.append((span_start, span_end, page, tokens, opens))
+            return
+        pieces = _split(text, span_start, span_end, _LINE_BREAK) if level == 0 else _split_words(text, span_start, span_end, max_tokens)
+        for i, (piece_start, piece_end) in enumerate(pieces):
+            add(piece_start, piece_end, opens and i == 0, level + 1)
+
+    for paragraph_start, paragraph_end in _split(text, start, end, _PARAGRAPH_BREAK):
+        for i, (sentence_start, sentence_end) in enumerate(_split(text, paragraph_start, paragraph_end, _SENTENCE_END)):
+            add(sentence_start, sentence_end, i == 0, 0)
+    return units
+
+
+def _overlap(group: list, overlap_tokens: int) -> list:
+    """
+    The trailing units of group that fit in overlap_tokens.
+    """
+    carried, tokens = [], 0
+    for unit in reversed(group):
+        tokens += unit[3] + 1
+        if tokens > overlap_tokens:
+            break
+        carried.insert(0, unit)
+    return carried
+
+
+def iter_chunks(pages, max_tokens: int = None, overlap_tokens: int = None):
+    """
+    Splits a document, given as an iterable of page texts, into chunks of at most max_tokens tokens
+    that end on sentence boundaries, preferring paragraph and page breaks once a chunk is half full.
+    Consecutive chunks share up to overlap_tokens tokens of whole sentences. Yields
+    {"content", "chunk_index", "page_start", "page_end", "char_start", "char_end", "token_count"}
+    with 1-based pages and offsets into document_text(pages). Pages are consumed lazily and only
+    the text of the chunk being built is kept.
+    """
+    max_tokens = max_tokens or CHUNK_MAX_TOKENS
+    overlap_tokens = CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+
+    def size(group):
+        # One token for the whitespace between units
+        return sum(unit[3] for unit in group) + max(len(group) - 1, 0)
+
+    # buffer holds the document text from offset base on
+    buffer, base, offset = "", 0, 0
+    group, carried, chunk_index = [], 0, 0
+    for number, page_text in enumerate(pages, start=1):
+        if number > 1:
+            buffer += PAGE_SEPARATOR
+            offset += len(PAGE_SEPARATOR)
+        buffer += page_text
+        for start, end, page, tokens, opens in _units(page_text, 0, len(page_text), number, max_tokens):
+            unit = (offset + start, offset + end, page, tokens, opens)
+            if len(group) > carried and size(group) + 1 + unit[3] > max_tokens:
+                # Break at the last paragraph or page start in the second half of the chunk, if the
+                # sentences after it still fit with the next one
+                cut = len(group)
+                for i in range(len(group) - 1, carried, -1):
+                    if size(group[:i]) < max_tokens // 2:
+                        break
+                    if (group[i][4] or group[i][2] != group[i - 1][2]) and size(group[i:]) + 1 + unit[3] <= max_tokens:
+                        cut = i
+                        break
+                yield _chunk(buffer, base, group[:cut], chunk_index)
+                chunk_index += 1
+                overlap = _overlap(group[:cut], overlap_tokens)
+                group, carried = overlap + group[cut:], len(overlap)
+                while group[:carried] and size(group) + 1 + unit[3] > max_tokens:
+                    group, carried = group[1:], carried - 1
+                # Drop text before the chunk being built
+                keep_from = group[0][0] if group else unit[0]
+                buffer, base = buffer[keep_from - base:], keep_from
+            group.append(unit)
+        offset += len(page_text)
+    if len(group) > carried:
+        yield _chunk(buffer, base, group, chunk_index)
+
+
+def _chunk(buffer: str, base: int, group: list, chunk_index: int) -> dict:
+    start, end = group[0][0], group[-1][1]
+    content = buffer[start - base:end - base]
+    return {
+        "content": content,
+        "chunk_index": chunk_index,
+        "page_start": group[0][2],
+        "page_end": group[-1][2],
+        "char_start": start,
+        "char_end": end,
+        "token_count": count_tokens(content)
+    }
+
+
+def chunk_pages(pages, max_tokens: int = None, overlap_tokens: int = None) -> list:
+    return list(iter_chunks(pages, max_tokens, overlap_tokens))
@@ -0,0 +1,156 @@
+import os
+import time
+import array
+import hashlib
+import logging
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from openai import AzureOpenAI
+
+EMBED_DEPLOYMENT = os.getenv("EMBED_DEPLOYMENT", "text-embedding-ada-002")
+EMBED_API_KEY = os.getenv("EMBED_API_KEY")
+EMBED_ENDPOINT = os.getenv("EMBED_ENDPOINT")
+EMBED_API_VERSION = os.getenv("EMBED_API_VERSION", "2023-05-15")
+# Per-request limits of the embeddings API: number of inputs (16 for older Azure API versions,
+# up to 2048 on current ones) and total tokens across them
+EMBED_MAX_INPUTS = int(os.getenv("EMBED_MAX_INPUTS", "16"))
+EMBED_MAX_REQUEST_TOKENS = int(os.getenv("EMBED_MAX_REQUEST_TOKENS", "100000"))
+
+# Vectors of chunks already embedded, keyed by chunk hash: an in-process LRU in front of SQLite.
+# On Functions the file lives on the instance's local disk, so it survives invocations but not scale-out.
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(tempfile.gettempdir(), "docupilot_embedding_cache.sqlite3"))
+EMBEDDING_CACHE_MEMORY_SIZE = int(os.getenv("EMBEDDING_CACHE_MEMORY_SIZE", "4096"))
+
+_client = None
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        _client = AzureOpenAI(api_key=EMBED_API_KEY, api_version=EMBED_API_VERSION, azure_endpoint=EMBED_ENDPOINT)
+    return _client
+
+
+def chunk_hash(content: str) -> str:
+    """
+    Identifies a chunk's text for the embedding deployment in use.
+    """
+    return hashlib.sha256(f"{EMBED_DEPLOYMENT}\n{content}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache of embedding vectors keyed by chunk hash: an in-process LRU in front of a
+    SQLite table. Vectors are stored as packed float32, the precision the search index keeps.
+    """
+
+    def __init__(self, db_path: str, memory_size: int):
+        self.memory_size = memory_size
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+
+    def get_many(self, keys: list) -> dict:
+        found = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+                else:
+                    missing.append(key)
+            # SQLite's default limit on bound parameters is 999
+            for i in range(0, len(missing), 500):
+                batch = missing[i:i + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array.array("f", blob).tolist()
+                    self._remember(key, vector)
+                    found[key] = vector
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, vectors: dict):
+        with self._lock:
+            for key, vector in vectors.items():
+                self._remember(key, vector)
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, created_at) VALUES (?, ?, ?)",
+                    [(key, array.array("f", vector).tobytes(), time.time()) for key, vector in vectors.items()]
+                )
+
+    def _remember(self, key: str, vector: list):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "memory_entries": len(self._memory)}
+
+embedding_cache = None
+if EMBEDDING_CACHE_ENABLED:
+    try:
+        embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MEMORY_SIZE)
+    except sqlite3.Error as e:
+        logging.warning(f"Embedding cache disabled: {e}")
+
+
+def _batches(chunks: list):
+    """
+    Groups chunks into requests of at most EMBED_MAX_INPUTS inputs and EMBED_MAX_REQUEST_TOKENS tokens.
+    """
+    batch, tokens = [], 0
+    for chunk in chunks:
+        if batch and (len(batch) >= EMBED_MAX_INPUTS or tokens + chunk["token_count"] > EMBED_MAX_REQUEST_TOKENS):
+            yield batch
+            batch, tokens = [], 0
+        batch.append(chunk)
+        tokens += chunk["token_count"]
+    if batch:
+        yield batch
+
+
+def embed_chunks(chunks: list) -> dict:
+    """
+    Sets chunk["text_vector"] on every chunk. Vectors come from the cache where the chunk text
+    was embedded before; the rest are requested in batched embeddings.create calls.
+    Returns {"chunks", "cached", "embedded", "requests", "seconds"}.
+    """
+    started = time.perf_counter()
+    keys = [chunk_hash(chunk["content"]) for chunk in chunks]
+    vectors = embedding_cache.get_many(list(set(keys))) if embedding_cache else {}
+    cached = sum(key in vectors for key in keys)
+
+    # Identical chunk texts are embedded once
+    todo = {}
+    for key, chunk in zip(keys, chunks):
+        if key not in vectors and key not in todo:
+            todo[key] = chunk
+    requests = 0
+    for batch in _batches(list(todo.values())):
+        response = _get_client().embeddings.create(input=[chunk["content"] for chunk in batch], model=EMBED_DEPLOYMENT)
+        requests += 1
+        fresh = {chunk_hash(chunk["content"]): item.embedding for chunk, item in zip(batch, sorted(response.data, key=lambda d: d.index))}
+        vectors.update(fresh)
+        if embedding_cache:
+            embedding_cache.put_many(fresh)
+
+    for key, chunk in zip(keys, chunks):
+        chunk["text_vector"] = vectors[key]
+    return {"chunks": len(chunks), "cached": cached, "embedded": len(todo), "requests": requests, "seconds": round(time.perf_counter() - started, 3)}
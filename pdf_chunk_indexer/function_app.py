@@ -3,13 +3,21 @@ import os
 import azure.functions as func
 from azure.search.documents import SearchClient
 from azure.core.credentials import AzureKeyCredential
-import fitz  # PyMuPDF
-import tempfile
+from chunking import chunk_pages
+from page_extraction import iter_page_texts, summarize_page_metrics
+from embeddings import embed_chunks
+from manifest import (
+    assign_chunk_ids, content_hash, diff_chunks, document_key, is_unchanged, load_manifest, save_manifest
+)
 
 # Environment variables (set in local.settings.json or Azure portal)
 SEARCH_ENDPOINT = os.getenv("SEARCH_ENDPOINT")
 SEARCH_API_KEY = os.getenv("SEARCH_API_KEY")
 SEARCH_INDEX = os.getenv("SEARCH_INDEX")
+# Chunks per upload_documents call; with 1536-dim vectors each chunk is ~30 KB of JSON
+SEARCH_UPLOAD_BATCH_SIZE = int(os.getenv("SEARCH_UPLOAD_BATCH_SIZE", "100"))
+# Actions per indexing request allowed by Azure AI Search
+SEARCH_MAX_BATCH_ACTIONS = 1000
 
 # Initialize SearchClient
 search_client = SearchClient(
@@ -18,34 +26,69 @@ search_client = SearchClient(
     credential=AzureKeyCredential(SEARCH_API_KEY)
 )
 
-def extract_text_from_pdf(pdf_bytes):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        tmp.write(pdf_bytes)
-        tmp.flush()
-        doc = fitz.open(tmp.name)
-        text = ""
-        for page in doc:
-            text += page.get_text()
-        doc.close()
-    os.unlink(tmp.name)
-    return text
+def extract_pages_from_pdf(pdf_bytes, metrics=None):
+    """
+    Yields the text of each page, opening the PDF from memory and loading one page at a time, so
+    the chunker can consume pages as they are parsed. Scanned pages are OCRed in parallel.
+    """
+    return iter_page_texts(pdf_bytes, metrics)
 
-def chunk_text(text, chunk_size=1000):
-    # Simple chunking logic
-    return [text[i:i+chunk_size] for i in range(0, len(text), chunk_size)]
+def chunk_text(pages):
+    """
+    Token-sized chunks that break on page, paragraph and sentence boundaries, with overlap.
+    """
+    return chunk_pages(pages)
 
 def index_chunks(applicant_id, document_type, file_name, chunks):
+    embedding_stats = embed_chunks(chunks)
+    logging.info(f"Embeddings for {file_name}: {embedding_stats}")
     docs = []
-    for i, chunk in enumerate(chunks):
+    for chunk in chunks:
         docs.append({
-            "id": f"{applicant_id}_{document_type}_{file_name}_{i}",
+            "id": chunk["id"],
             "applicant_id": applicant_id,
             "document_type": document_type,
             "file_name": file_name,
-            "content": chunk
+            "content": chunk["content"],
+            "page_start": chunk["page_start"],
+            "page_end": chunk["page_end"],
+            "char_start": chunk["char_start"],
+            "char_end": chunk["char_end"],
+            "text_vector": chunk["text_vector"]
         })
-    result = search_client.upload_documents(documents=docs)
-    return result
+    results = []
+    for i in range(0, len(docs), SEARCH_UPLOAD_BATCH_SIZE):
+        results.extend(search_client.upload_documents(documents=docs[i:i + SEARCH_UPLOAD_BATCH_SIZE]))
+    return results
+
+def delete_chunks(chunk_ids):
+    """
+    Removes orphaned chunks in a single indexing batch (split only past the service's action limit).
+    """
+    results = []
+    for i in range(0, len(chunk_ids), SEARCH_MAX_BATCH_ACTIONS):
+        batch = chunk_ids[i:i + SEARCH_MAX_BATCH_ACTIONS]
+        results.extend(search_client.delete_documents(documents=[{"id": chunk_id} for chunk_id in batch]))
+    return results
+
+def find_indexed_chunk_ids(applicant_id, document_type, file_name):
+    """
+    Ids already in the index for a document that has no manifest yet, e.g. chunks written before
+    manifests existed. Needs applicant_id, document_type and file_name to be filterable; returns
+    an empty list otherwise.
+    """
+    def quote(value):
+        return "'" + value.replace("'", "''") + "'"
+    try:
+        results = search_client.search(
+            search_text="*",
+            filter=f"applicant_id eq {quote(applicant_id)} and document_type eq {quote(document_type)} and file_name eq {quote(file_name)}",
+            select=["id"]
+        )
+        return [result["id"] for result in results]
+    except Exception as e:
+        logging.warning(f"Could not look up existing chunks of {file_name}: {e}")
+        return []
 
 def main(blob: func.InputStream):
     """
@@ -61,8 +104,35 @@ def main(blob: func.InputStream):
         return
 
     applicant_id, document_type, file_name = parts[-3], parts[-2], parts[-1]
+    # The blob trigger binding has already loaded the whole blob into memory
     pdf_bytes = blob.read()
-    text = extract_text_from_pdf(pdf_bytes)
-    chunks = chunk_text(text)
-    index_chunks(applicant_id, document_type, file_name, chunks)
-    logging.info(f"Indexed {len(chunks)} chunks for {file_name}")
+    content_sha256 = content_hash(pdf_bytes)
+    manifest = load_manifest(applicant_id, document_type, file_name)
+    if is_unchanged(manifest, content_sha256):
+        logging.info(f"{file_name} is unchanged since it was last indexed; skipping")
+        return
+
+    page_metrics = []
+    pages = extract_pages_from_pdf(pdf_bytes, page_metrics)
+    chunks = chunk_text(pages)
+    logging.info(f"Page extraction for {file_name}: {summarize_page_metrics(page_metrics)}")
+
+    fingerprints = assign_chunk_ids(document_key(applicant_id, document_type, file_name), chunks)
+    if manifest is not None:
+        previous = manifest["chunks"]
+    else:
+        previous = {chunk_id: None for chunk_id in find_indexed_chunk_ids(applicant_id, document_type, file_name)}
+    upsert_ids, delete_ids = diff_chunks(previous, fingerprints)
+    upsert_ids = set(upsert_ids)
+    changed = [chunk for chunk in chunks if chunk["id"] in upsert_ids]
+
+    results = index_chunks(applicant_id, document_type, file_name, changed) if changed else []
+    if delete_ids:
+        results += delete_chunks(delete_ids)
+    failed = [result.key for result in results if not result.succeeded]
+    if failed:
+        # No manifest update, so the next upload of this blob retries the whole diff
+        logging.error(f"{len(failed)} index operations failed for {file_name}: {failed[:10]}")
+        return
+    save_manifest(applicant_id, document_type, file_name, content_sha256, fingerprints)
+    logging.info(f"Indexed {file_name}: {len(chunks)} chunks, {len(changed)} upserted, {len(delete_ids)} deleted, {len(chunks) - len(changed)} unchanged")
@@ -0,0 +1,105 @@
+import os
+import json
+import time
+import hashlib
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+from azure.storage.blob import BlobServiceClient
+from chunking import CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, CHUNK_ENCODING
+from embeddings import EMBED_DEPLOYMENT
+
+# One JSON manifest per indexed document: its content hash, the settings it was chunked with and
+# the id and fingerprint of every chunk in the search index
+INDEX_MANIFEST_CONTAINER = os.getenv("INDEX_MANIFEST_CONTAINER", "index-manifests")
+INDEX_MANIFEST_CONNECTION_STRING = os.getenv("INDEX_MANIFEST_CONNECTION_STRING") or os.getenv("AzureWebJobsStorage")
+
+# A change to any of these re-chunks every document on its next upload
+INDEX_SETTINGS = {
+    "chunk_max_tokens": CHUNK_MAX_TOKENS,
+    "chunk_overlap_tokens": CHUNK_OVERLAP_TOKENS,
+    "chunk_encoding": CHUNK_ENCODING,
+    "embed_deployment": EMBED_DEPLOYMENT,
+    "version": 1
+}
+
+_container_client = None
+
+
+def _get_container():
+    global _container_client
+    if _container_client is None:
+        service = BlobServiceClient.from_connection_string(INDEX_MANIFEST_CONNECTION_STRING)
+        container = service.get_container_client(INDEX_MANIFEST_CONTAINER)
+        try:
+            container.create_container()
+        except ResourceExistsError:
+            pass
+        _container_client = container
+    return _container_client
+
+
+def _manifest_name(applicant_id: str, document_type: str, file_name: str) -> str:
+    return f"{applicant_id}/{document_type}/{file_name}.json"
+
+
+def load_manifest(applicant_id: str, document_type: str, file_name: str):
+    """
+    The stored manifest of a document, or None if it was never indexed with one.
+    """
+    try:
+        data = _get_container().download_blob(_manifest_name(applicant_id, document_type, file_name)).readall()
+    except ResourceNotFoundError:
+        return None
+    return json.loads(data)
+
+
+def save_manifest(applicant_id: str, document_type: str, file_name: str, content_sha256: str, chunk_fingerprints: dict):
+    manifest = {
+        "content_sha256": content_sha256,
+        "settings": INDEX_SETTINGS,
+        "chunks": chunk_fingerprints,
+        "indexed_at": time.time()
+    }
+    _get_container().upload_blob(
+        _manifest_name(applicant_id, document_type, file_name), json.dumps(manifest), overwrite=True
+    )
+
+
+def is_unchanged(manifest, content_sha256: str) -> bool:
+    return bool(manifest) and manifest.get("content_sha256") == content_sha256 and manifest.get("settings") == INDEX_SETTINGS
+
+
+def document_key(applicant_id: str, document_type: str, file_name: str) -> str:
+    # Search keys allow only letters, digits, '_', '-' and '='; file names often contain more
+    return hashlib.sha256(f"{applicant_id}/{document_type}/{file_name}".encode("utf-8")).hexdigest()[:24]
+
+
+def assign_chunk_ids(doc_key: str, chunks: list) -> dict:
+    """
+    Sets chunk["id"] from the document key and the chunk text, so an unchanged chunk keeps its id
+    when text is inserted before it. Repeated texts are told apart by occurrence. Returns
+    {id: fingerprint}; the fingerprint also covers the page and offset fields, so a chunk that
+    only moved is re-uploaded (without being re-embedded).
+    """
+    fingerprints = {}
+    occurrences = {}
+    for chunk in chunks:
+        text_hash = hashlib.sha256(chunk["content"].encode("utf-8")).hexdigest()
+        occurrence = occurrences.get(text_hash, 0)
+        occurrences[text_hash] = occurrence + 1
+        chunk["id"] = f"{doc_key}-{text_hash[:32]}-{occurrence}"
+        position = f'{chunk["page_start"]}:{chunk["page_end"]}:{chunk["char_start"]}:{chunk["char_end"]}'
+        fingerprints[chunk["id"]] = hashlib.sha256(f"{text_hash}:{position}".encode("utf-8")).hexdigest()[:32]
+    return fingerprints
+
+
+def diff_chunks(previous: dict, current: dict):
+    """
+    (ids to upsert, ids to delete) between the chunk fingerprints of two manifests.
+    """
+    upsert = [chunk_id for chunk_id, fingerprint in current.items() if previous.get(chunk_id) != fingerprint]
+    delete = [chunk_id for chunk_id in previous if chunk_id not in current]
+    return upsert, delete
+
+
+def content_hash(data) -> str:
+    return hashlib.sha256(data).hexdigest()
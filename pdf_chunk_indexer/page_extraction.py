@@ -0,0 +1,127 @@
+import os
+import io
+import time
+import atexit
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import fitz  # PyMuPDF
+import pytesseract
+from PIL import Image
+
+# Pages whose text layer has fewer non-whitespace characters than this are treated as scans and OCRed
+OCR_ENABLED = os.getenv("OCR_ENABLED", "true").lower() == "true"
+OCR_MIN_TEXT_CHARS = int(os.getenv("OCR_MIN_TEXT_CHARS", "20"))
+OCR_DPI = int(os.getenv("OCR_DPI", "300"))
+OCR_LANGUAGE = os.getenv("OCR_LANGUAGE", "eng")
+# Worker processes for OCR (0 = one per CPU); pages awaiting OCR are capped at twice this
+OCR_MAX_WORKERS = int(os.getenv("OCR_MAX_WORKERS", "0")) or os.cpu_count() or 1
+# Seconds allowed for one page before it is indexed without text
+OCR_PAGE_TIMEOUT_SECONDS = float(os.getenv("OCR_PAGE_TIMEOUT_SECONDS", "120"))
+
+_pool = None
+
+
+def _get_pool():
+    # One pool per Functions worker process, reused across invocations. Workers are spawned, not
+    # forked: the Functions host is multithreaded (grpc, logging, blob clients) and a forked child
+    # can deadlock on a lock another thread held at fork time.
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=OCR_MAX_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        atexit.register(_shutdown_pool)
+    return _pool
+
+
+def _shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _ocr_page(png: bytes, language: str):
+    """
+    Runs in a worker process. Returns (text, seconds).
+    """
+    started = time.perf_counter()
+    try:
+        with Image.open(io.BytesIO(png)) as image:
+            text = pytesseract.image_to_string(image, lang=language)
+    except Exception as e:
+        # pytesseract's exceptions cannot be unpickled in the parent, which would break the pool
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+    return text, time.perf_counter() - started
+
+
+def _needs_ocr(text: str) -> bool:
+    return OCR_ENABLED and sum(not ch.isspace() for ch in text) < OCR_MIN_TEXT_CHARS
+
+
+def iter_page_texts(pdf_bytes, metrics: list = None):
+    """
+    Yields the text of each page of a PDF in page order. Pages without a usable text layer are
+    rendered with PyMuPDF and OCRed with Tesseract in a process pool while later pages are read,
+    so a scanned document keeps every core busy. When metrics is a list, one
+    {"page", "method", "chars", "seconds"} entry per page is appended; method is "text", "ocr" or
+    "ocr_failed", and seconds covers text extraction, or rendering plus OCR.
+    """
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    # (page number, text or OCR future, seconds spent in this process)
+    pending = deque()
+    in_flight = 0
+
+    def emit():
+        nonlocal in_flight
+        number, item, seconds = pending.popleft()
+        method = "text"
+        if not isinstance(item, str):
+            in_flight -= 1
+            try:
+                item, ocr_seconds = item.result(timeout=OCR_PAGE_TIMEOUT_SECONDS)
+                method, seconds = "ocr", seconds + ocr_seconds
+            except Exception as e:
+                logging.warning(f"OCR failed for page {number}: {e}")
+                item, method = "", "ocr_failed"
+        if metrics is not None:
+            metrics.append({"page": number, "method": method, "chars": len(item), "seconds": round(seconds, 3)})
+        return item
+
+    try:
+        for page in doc:
+            started = time.perf_counter()
+            text = page.get_text()
+            if _needs_ocr(text):
+                png = page.get_pixmap(dpi=OCR_DPI, colorspace=fitz.csGRAY).tobytes("png")
+                pending.append((page.number + 1, _get_pool().submit(_ocr_page, png, OCR_LANGUAGE), time.perf_counter() - started))
+                in_flight += 1
+            else:
+                pending.append((page.number + 1, text, time.perf_counter() - started))
+            # Hand back finished pages in order, and wait once enough OCR work is queued
+            while pending and (isinstance(pending[0][1], str) or pending[0][1].done() or in_flight > 2 * OCR_MAX_WORKERS):
+                yield emit()
+        while pending:
+            yield emit()
+    finally:
+        for _, item, _ in pending:
+            if not isinstance(item, str):
+                item.cancel()
+        doc.close()
+
+
+def summarize_page_metrics(metrics: list) -> dict:
+    """
+    Totals for logging: pages, pages OCRed, failures, seconds and the slowest page.
+    """
+    ocr = [m for m in metrics if m["method"] != "text"]
+    slowest = max(metrics, key=lambda m: m["seconds"], default=None)
+    return {
+        "pages": len(metrics),
+        "ocr_pages": len(ocr),
+        "ocr_failed": sum(m["method"] == "ocr_failed" for m in metrics),
+        "text_seconds": round(sum(m["seconds"] for m in metrics if m["method"] == "text"), 3),
+        "ocr_seconds": round(sum(m["seconds"] for m in ocr), 3),
+        "slowest_page": slowest["page"] if slowest else None,
+        "slowest_seconds": slowest["seconds"] if slowest else 0.0
+    }
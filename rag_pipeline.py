@@ -19,6 +19,8 @@ SEARCH_ENDPOINT = os.getenv("SEARCH_ENDPOINT")
 SEARCH_API_KEY = os.getenv("SEARCH_API_KEY")
 INDEX_NAME = "rag-2"
 VECTOR_FIELD = "text_vector"
+# Chunks retrieved per question; token-sized, sentence-aligned chunks need fewer than fixed slices
+TOP_K = int(os.getenv("RAG_TOP_K", "4"))
 
 # Azure OpenAI chat completion
 CHAT_ENDPOINT = os.getenv("CHAT_ENDPOINT")
@@ -42,7 +44,7 @@ def get_embedding(prompt: str):
     return response.data[0].embedding
 
 
-def search_vector_top_k(embedding, k=7):
+def search_vector_top_k(embedding, k=TOP_K):
     url = f"{SEARCH_ENDPOINT}/indexes/{INDEX_NAME}/docs/search?api-version=2023-10-01-Preview"
 
     headers = {
@@ -85,7 +87,10 @@ def build_context(docs):
         text = doc.get("chunk", "").replace("\n", " ").strip()
         if not text:
             continue
-        formatted_chunks.append(f"filename : [{filename}]\n text : {text}")
+        pages = ""
+        if doc.get("page_start") is not None:
+            pages = f" (pages {doc['page_start']}-{doc.get('page_end', doc['page_start'])})"
+        formatted_chunks.append(f"filename : [{filename}]{pages}\n text : {text}")
     return "\n\n".join(formatted_chunks), file_set
 
 
@@ -0,0 +1,125 @@
+"""
+Offline extraction benchmark: replays recorded Form Recognizer results through the full extraction
+path (field mapping, heuristics, fallbacks) without network access.
+
+Record fixtures once against the real service:
+    FORM_RECOGNIZER_BACKEND=record streamlit run loan_docu_pilot_app.py
+
+Then replay them (or synthetic ones when no fixtures exist):
+    python tests/benchmark_extraction_replay.py [--fixtures DIR] [--documents 2000] [--latency-ms 0] [--profile]
+"""
+import argparse
+import cProfile
+import contextlib
+import glob
+import io
+import json
+import os
+import pstats
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import azure_extraction
+from azure_extraction import (
+    FORM_RECOGNIZER_FIXTURE_DIR, MODEL_MAP, ReplayAnalysisBackend, extract_fields_with_model,
+    load_analyze_fixture, set_analysis_backend
+)
+
+
+def _line(content):
+    return {"content": content, "polygon": [], "spans": []}
+
+
+def _page(number, lines):
+    return {
+        "page_number": number, "angle": 0, "width": 8.5, "height": 11, "unit": "inch",
+        "lines": [_line(line) for line in lines], "words": [], "spans": [], "selection_marks": []
+    }
+
+
+def synthetic_results(seed: int = 7) -> dict:
+    """{doc_type: AnalyzeResult dict} for a bank statement, an ITR and a credit report."""
+    rng = random.Random(seed)
+    statement_pages = [["HDFC BANK LTD", "Statement of Account", "Account Number: 50100234567890", "IFSC: HDFC0001234"]]
+    for page in range(2, 6):
+        statement_pages.append([
+            f"{rng.randint(1, 28):02d}/0{rng.randint(1, 9)}/2024 UPI/{rng.randint(10**9, 10**10)}/PAYMENT {rng.randint(100, 99999):,}.00 CR"
+            for _ in range(60)
+        ])
+    documents = {
+        "Bank Statement": statement_pages,
+        "Income Tax Return": [["INDIAN INCOME TAX RETURN ACKNOWLEDGEMENT", "Assessment Year 2023-24", "PAN ABCDE1234F", "Gross Income 8,00,000"]],
+        "Credit Report": [["CIBIL Report", "Applicant Name: Rahul Sharma", "CIBIL Score: 750 (As of 01-01-2024)"]],
+    }
+    results = {}
+    for doc_type, pages in documents.items():
+        results[doc_type] = {
+            "api_version": "2023-07-31", "model_id": MODEL_MAP[doc_type], "content": "",
+            "pages": [_page(i + 1, lines) for i, lines in enumerate(pages)],
+            "key_value_pairs": [], "tables": [], "documents": [], "paragraphs": [], "styles": [], "languages": []
+        }
+    return results
+
+
+def load_cases(fixture_dir: str):
+    """(label, fixture key, doc_type) for every fixture and every doc type that uses its model."""
+    cases = []
+    for path in sorted(glob.glob(os.path.join(fixture_dir, "*.json"))):
+        fixture = load_analyze_fixture(path)
+        for doc_type, model_id in MODEL_MAP.items():
+            if model_id == fixture["model_id"]:
+                cases.append((os.path.basename(path), fixture["key"], doc_type))
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", default=FORM_RECOGNIZER_FIXTURE_DIR)
+    parser.add_argument("--documents", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--profile", action="store_true", help="print the top functions by cumulative time")
+    args = parser.parse_args()
+
+    fixture_dir = args.fixtures
+    cases = load_cases(fixture_dir) if os.path.isdir(fixture_dir) else []
+    if not cases:
+        # No recordings yet: write synthetic fixtures through the same replay path
+        fixture_dir = tempfile.mkdtemp(prefix="docupilot_fixtures_")
+        print(f"No fixtures in {args.fixtures}; using synthetic fixtures in {fixture_dir}")
+        for doc_type, result in synthetic_results().items():
+            key = f"synthetic_{doc_type.replace(' ', '_').lower()}"
+            with open(os.path.join(fixture_dir, key + ".json"), "w", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "model_id": result["model_id"], "pages": None, "recorded_at": 0, "result": result}))
+            cases.append((key, key, doc_type))
+
+    backend = ReplayAnalysisBackend(fixture_dir, args.latency_ms / 1000)
+    set_analysis_backend(backend)
+
+    def run():
+        # Keep extraction logs out of the timing
+        with contextlib.redirect_stdout(io.StringIO()):
+            for n in range(args.documents):
+                label, key, doc_type = cases[n % len(cases)]
+                result = backend.result_for_key(key)
+                extract_fields_with_model(None, doc_type, analyze_result=result, analyze_model_id=MODEL_MAP[doc_type])
+
+    profiler = cProfile.Profile() if args.profile else None
+    started = time.perf_counter()
+    if profiler:
+        profiler.runcall(run)
+    else:
+        run()
+    seconds = time.perf_counter() - started
+    print(f"{args.documents} documents over {len(cases)} fixture/doc-type cases in {seconds:.2f}s: {args.documents / seconds:,.0f} docs/s")
+    for stage, stats in azure_extraction.get_extraction_stage_stats().items():
+        print(f"  {stage:<14} {stats['avg_ms']:8.3f} ms avg over {stats['runs']} runs")
+    if profiler:
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Micro-benchmark: compiled field extractor registry vs. the previous per-field regex scanning.
+
+Usage:
+    python tests/benchmark_field_extractors.py [--pages 50] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from field_extractors import extract_fields_with_patterns, get_label_fallback_scanner
+
+BANK_FIELD_MAP = {
+    "Account Number": "AccountNumber",
+    "IFSC Code": "IFSC",
+    "Bank Name": "BankName"
+}
+
+
+def make_statement(pages: int, with_header: bool = True, seed: int = 7) -> str:
+    """Synthetic bank statement text: an optional header block followed by transaction lines."""
+    rng = random.Random(seed)
+    lines = []
+    if with_header:
+        lines += ["HDFC BANK LTD", "Statement of Account", "Bank Name: HDFC Bank", "Account Number: 50100234567890"]
+    for page in range(pages):
+        lines.append(f"Page {page + 1}")
+        for _ in range(60):
+            amount = rng.randint(100, 99999)
+            lines.append(f"{rng.randint(1, 28):02d}/0{rng.randint(1, 9)}/2024 UPI/{rng.randint(10**9, 10**10)}/PAYMENT {amount:,}.00 CR")
+    if with_header:
+        lines.append("IFSC: HDFC0001234")
+    return "\n".join(lines) + "\n"
+
+
+def legacy_bank_regex(full_text: str) -> dict:
+    # Previous implementation: one re.search per field over the whole text
+    fields = {}
+    match = re.search(r"(Account Number|A/C No\.?|A\/C No\.?):?\s*([A-Za-z0-9\-]+)", full_text, re.IGNORECASE)
+    if match:
+        fields["AccountNumber"] = match.group(2)
+    match = re.search(r"IFSC\s*[:\-]?\s*([A-Za-z0-9]+)", full_text, re.IGNORECASE)
+    if match:
+        fields["IFSC"] = match.group(1)
+    match = re.search(r"Bank Name\s*[:\-]?\s*([A-Za-z0-9\s]+)", full_text, re.IGNORECASE)
+    if match:
+        fields["BankName"] = match.group(1).strip()
+    return fields
+
+
+def legacy_label_fallback(full_text: str, missing, field_map) -> dict:
+    # Previous implementation: an f-string regex per label variation per missing field
+    fields = {}
+    for must in missing:
+        for label in [k for k, v in field_map.items() if v == must]:
+            match = re.search(rf"{label}\s*[:\-]?\s*([A-Za-z0-9 ,./]+)", full_text, re.IGNORECASE)
+            if match:
+                fields[must] = match.group(1).strip()
+                break
+    return fields
+
+
+def bench(label: str, fn, repeat: int):
+    seconds = min(timeit.repeat(fn, number=1, repeat=repeat))
+    print(f"  {label:<28} {seconds * 1000:8.2f} ms")
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    missing = ["AccountNumber", "IFSC", "BankName"]
+    scanner = get_label_fallback_scanner(BANK_FIELD_MAP)
+    for with_header in (True, False):
+        text = make_statement(args.pages, with_header=with_header)
+        case = "labels present" if with_header else "labels missing (full scans)"
+        print(f"{args.pages}-page statement, {len(text):,} chars, {case}")
+
+        assert legacy_bank_regex(text) == extract_fields_with_patterns("Bank Statement", text)
+        legacy = bench("legacy doc-type regex", lambda: legacy_bank_regex(text), args.repeat)
+        registry = bench("registry doc-type regex", lambda: extract_fields_with_patterns("Bank Statement", text), args.repeat)
+        print(f"  speedup {legacy / registry:.1f}x")
+
+        assert legacy_label_fallback(text, missing, BANK_FIELD_MAP) == scanner.scan(text, missing)
+        legacy = bench("legacy label fallback", lambda: legacy_label_fallback(text, missing, BANK_FIELD_MAP), args.repeat)
+        registry = bench("registry label fallback", lambda: scanner.scan(text, missing), args.repeat)
+        print(f"  speedup {legacy / registry:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Checks of the indexer chunker: chunk offsets point back into the document text, chunks respect
+the token limit, and overlap stays within its budget.
+
+    python tests/test_chunking.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pdf_chunk_indexer"))
+
+from chunking import chunk_pages, count_tokens, document_text
+
+
+def _sample_pages():
+    sentences = [f"Sentence number {i} of the statement mentions an amount of {i * 137} rupees." for i in range(60)]
+    table = "\n".join(f"01-0{i % 9 + 1}-2024 | NEFT transfer {i} | {i * 10}.00 | {i * 99}.50" for i in range(40))
+    return [
+        " ".join(sentences[:20]) + "\n\n" + " ".join(sentences[20:30]),
+        table,
+        " ".join(sentences[30:]),
+        "",
+        "Averyveryverylongwordwithoutanyspaces" * 80,
+    ]
+
+
+def test_offsets_point_into_document_text():
+    pages = _sample_pages()
+    text = document_text(pages)
+    chunks = chunk_pages(pages, max_tokens=64, overlap_tokens=16)
+    assert chunks
+    for chunk in chunks:
+        assert text[chunk["char_start"]:chunk["char_end"]] == chunk["content"]
+        assert 1 <= chunk["page_start"] <= chunk["page_end"] <= len(pages)
+    assert [chunk["chunk_index"] for chunk in chunks] == list(range(len(chunks)))
+
+
+def test_token_limit():
+    pages = _sample_pages()
+    for max_tokens in (32, 64, 200):
+        for chunk in chunk_pages(pages, max_tokens=max_tokens, overlap_tokens=16):
+            assert chunk["token_count"] == count_tokens(chunk["content"])
+            assert chunk["token_count"] <= max_tokens, (max_tokens, chunk["token_count"])
+
+
+def test_overlap_and_coverage():
+    pages = _sample_pages()
+    text = document_text(pages)
+    chunks = chunk_pages(pages, max_tokens=64, overlap_tokens=16)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        # Chunks move forward, and any overlap is at most the overlap budget
+        assert chunk["char_start"] > previous["char_start"]
+        if chunk["char_start"] < previous["char_end"]:
+            assert count_tokens(text[chunk["char_start"]:previous["char_end"]]) <= 16
+    # Every non-whitespace character is covered by some chunk
+    covered = [False] * len(text)
+    for chunk in chunks:
+        covered[chunk["char_start"]:chunk["char_end"]] = [True] * (chunk["char_end"] - chunk["char_start"])
+    assert all(covered[i] for i, ch in enumerate(text) if not ch.isspace())
+
+
+def test_empty_document():
+    assert chunk_pages([]) == []
+    assert chunk_pages(["", "  \n"]) == []
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name} passed")
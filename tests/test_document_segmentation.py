@@ -0,0 +1,64 @@
+"""
+Checks of merged-PDF segmentation in the upload pipeline: a PDF with pages of different document
+types is split, and a file PyMuPDF cannot split falls back to whole-file processing.
+
+    python tests/test_document_segmentation.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Importing the pipeline creates the (unused) OpenAI client, which needs settings to be present
+os.environ.setdefault("CHAT_API_KEY", "test")
+os.environ.setdefault("CHAT_ENDPOINT", "https://example.openai.azure.com/")
+
+import fitz  # PyMuPDF
+from azure.ai.formrecognizer import AnalyzeResult
+from document_pipeline import _segment_analysis
+
+# One page each of a PAN card, a passport and a bank statement: all classified by the local rules
+PAGES = [
+    ["INCOME TAX DEPARTMENT", "GOVT. OF INDIA", "Permanent Account Number Card", "ABCDE1234F"],
+    ["REPUBLIC OF INDIA", "Passport No. N1234567", "Date of Expiry 01/01/2030", "P<INDSHARMA<<RAHUL<<<<<<<<<<<<<<<<<<<<<<<<<"],
+    ["HDFC BANK", "Statement of Account", "IFSC: HDFC0001234", "Opening Balance 10,000", "Closing Balance 20,000"],
+]
+
+
+def _analysis(pages):
+    result = AnalyzeResult.from_dict({
+        "model_id": "prebuilt-document",
+        "pages": [
+            {"page_number": number, "lines": [{"content": line} for line in lines]}
+            for number, lines in enumerate(pages, start=1)
+        ]
+    })
+    return {"text": "", "reusable_result": result, "data": None, "preprocessing": {}, "ocr_seconds": 3.0}
+
+
+def _pdf(pages) -> bytes:
+    doc = fitz.open()
+    for lines in pages:
+        doc.new_page().insert_text((72, 72), "\n".join(lines))
+    return doc.tobytes()
+
+
+def test_merged_pdf_is_split():
+    parts = _segment_analysis("merged.pdf", _pdf(PAGES), _analysis(PAGES))
+    assert [classification["document_type"] for _, _, _, classification in parts] == ["PAN Card", "Passport", "Bank Statement"]
+    assert [analysis["segment"]["first_page"] for _, _, analysis, _ in parts] == [1, 2, 3]
+    for _, segment_bytes, _, _ in parts:
+        assert fitz.open(stream=segment_bytes, filetype="pdf").page_count == 1
+
+
+def test_corrupt_pdf_falls_back_to_whole_file():
+    # Cut off before the first page object, so PyMuPDF cannot repair it
+    pdf = _pdf(PAGES)
+    assert _segment_analysis("truncated.pdf", pdf[:300], _analysis(PAGES)) == []
+    assert _segment_analysis("corrupt.pdf", b"%PDF-1.7\nnot a pdf", _analysis(PAGES)) == []
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name} passed")
@@ -0,0 +1,41 @@
+"""
+Checks of the compiled regex heuristics in field_extractors against the per-field searches they
+replaced.
+
+    python tests/test_field_extractors.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from azure_extraction import FIELD_NAME_MAP
+from field_extractors import get_label_fallback_scanner
+
+PASSPORT_TEXT = "Passport No. N1234567\nSurname: SHARMA\nGiven Name: RAHUL"
+
+
+def test_label_fallback_keeps_label_priority():
+    # "Given Name" comes before "Name" in the field map, and "Name" must not match inside "Surname"
+    scanner = get_label_fallback_scanner(FIELD_NAME_MAP["Passport"])
+    assert scanner.scan(PASSPORT_TEXT, ["FirstName"]) == {"FirstName": "RAHUL"}
+    assert scanner.scan(PASSPORT_TEXT, ["LastName"]) == {"LastName": "SHARMA"}
+
+
+def test_label_fallback_matches_whole_words_only():
+    scanner = get_label_fallback_scanner({"Name": "FirstName"})
+    assert scanner.scan("Surname: SHARMA\nNickname: RAJ", ["FirstName"]) == {}
+    assert scanner.scan("Surname: SHARMA\nName: RAHUL", ["FirstName"]) == {"FirstName": "RAHUL"}
+
+
+def test_label_fallback_first_label_in_map_order_wins():
+    scanner = get_label_fallback_scanner({"Account Number": "AccountNumber", "A/C No.": "AccountNumber"})
+    text = "A/C No. 111222\nAccount Number: 333444"
+    assert scanner.scan(text, ["AccountNumber"]) == {"AccountNumber": "333444"}
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name} passed")
@@ -0,0 +1,46 @@
+"""
+Checks of the pre-OCR image shrinking in image_preprocessing.
+
+    python tests/test_image_preprocessing.py
+"""
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from image_preprocessing import preprocess_document, preprocess_image
+
+
+def _tiff(pages: int) -> bytes:
+    frames = [Image.new("RGB", (3000, 2000), (255, 255, 255 - 40 * i)) for i in range(pages)]
+    out = io.BytesIO()
+    frames[0].save(out, format="TIFF", save_all=True, append_images=frames[1:])
+    return out.getvalue()
+
+
+def test_multi_page_tiff_is_left_untouched():
+    data = _tiff(3)
+    assert preprocess_image(data) == (data, [])
+    processed, report = preprocess_document("statement.tiff", data, enabled=True)
+    assert processed is data
+    assert report["processed_bytes"] == report["original_bytes"] and report["steps"] == []
+    with Image.open(io.BytesIO(processed)) as image:
+        assert image.n_frames == 3
+
+
+def test_single_page_image_is_shrunk():
+    data = _tiff(1)
+    processed, report = preprocess_document("photo.tiff", data, enabled=True)
+    assert len(processed) < len(data)
+    assert report["steps"]
+    with Image.open(io.BytesIO(processed)) as image:
+        assert max(image.size) <= 2500 and image.mode == "L"
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name} passed")
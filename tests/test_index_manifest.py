@@ -0,0 +1,75 @@
+"""
+Checks of the indexer's incremental re-indexing: chunk ids from assign_chunk_ids and the
+upserts/deletes diff_chunks derives when chunks move, change or disappear.
+
+    python tests/test_index_manifest.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pdf_chunk_indexer"))
+
+from chunking import chunk_pages
+from manifest import assign_chunk_ids, diff_chunks
+
+DOC_KEY = "doc0123456789abcdef0123"
+
+
+def _chunk(content: str, page: int, char_start: int) -> dict:
+    return {"content": content, "page_start": page, "page_end": page, "char_start": char_start, "char_end": char_start + len(content)}
+
+
+def test_repeated_text_gets_distinct_ids():
+    chunks = [_chunk("Terms and conditions apply.", 1, 0), _chunk("Balance 100", 1, 40), _chunk("Terms and conditions apply.", 2, 80)]
+    fingerprints = assign_chunk_ids(DOC_KEY, chunks)
+    ids = [chunk["id"] for chunk in chunks]
+    assert len(set(ids)) == 3 and len(fingerprints) == 3
+    assert ids[0].endswith("-0") and ids[2].endswith("-1")
+    assert ids[0].rsplit("-", 1)[0] == ids[2].rsplit("-", 1)[0]
+    assert all(chunk_id.startswith(DOC_KEY + "-") for chunk_id in ids)
+
+
+def test_unchanged_document_has_empty_diff():
+    pages = ["First page. " * 40, "Second page. " * 40]
+    previous = assign_chunk_ids(DOC_KEY, chunk_pages(pages, max_tokens=64, overlap_tokens=8))
+    current = assign_chunk_ids(DOC_KEY, chunk_pages(pages, max_tokens=64, overlap_tokens=8))
+    assert diff_chunks(previous, current) == ([], [])
+
+
+def test_moved_changed_and_removed_chunks():
+    old = [_chunk("Name: Priya", 1, 0), _chunk("Balance 100", 1, 20), _chunk("Closing note", 2, 40)]
+    previous = assign_chunk_ids(DOC_KEY, old)
+    old_ids = [chunk["id"] for chunk in old]
+
+    # "Name: Priya" moves, "Balance 100" changes, "Closing note" disappears, a new chunk appears
+    new = [_chunk("Cover page", 1, 0), _chunk("Name: Priya", 1, 15), _chunk("Balance 250", 1, 35)]
+    current = assign_chunk_ids(DOC_KEY, new)
+    new_ids = [chunk["id"] for chunk in new]
+
+    upsert, delete = diff_chunks(previous, current)
+    # A moved chunk keeps its id but is re-uploaded for its new offsets
+    assert new_ids[1] == old_ids[0]
+    assert set(upsert) == set(new_ids)
+    assert set(delete) == {old_ids[1], old_ids[2]}
+
+
+def test_unchanged_chunk_is_not_reuploaded():
+    previous = assign_chunk_ids(DOC_KEY, [_chunk("Name: Priya", 1, 0), _chunk("Balance 100", 1, 20)])
+    current_chunks = [_chunk("Name: Priya", 1, 0), _chunk("Balance 120", 1, 20)]
+    current = assign_chunk_ids(DOC_KEY, current_chunks)
+    upsert, delete = diff_chunks(previous, current)
+    assert upsert == [current_chunks[1]["id"]]
+    assert len(delete) == 1 and delete[0] not in current
+
+
+def test_first_index_upserts_everything():
+    current = assign_chunk_ids(DOC_KEY, [_chunk("Name: Priya", 1, 0), _chunk("Balance 100", 1, 20)])
+    upsert, delete = diff_chunks({}, current)
+    assert set(upsert) == set(current) and delete == []
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name} passed")